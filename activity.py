@@ -0,0 +1,223 @@
+"""
+Journal d'activité
+log_activity() est le point d'entrée unique des routes : l'entrée est écrite avec la
+transaction de la requête (mode synchrone, tests) ou, après le commit, confiée à un
+thread qui l'insère par lots (INSERT multi-lignes) avec les compteurs et le flux SSE
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from models import db, ActivityLog
+from counters import adjust_counters, count_change
+from rollups import adjust_rollups, rollup_change
+from broadcast import ACTIVITY_BROADCAST_LIMIT, activity_event, publish_after_commit
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class ActivityWriter:
+    """
+    File bornée d'entrées du journal vidée par un thread d'arrière-plan
+    Une file pleine bloque l'appelant au plus enqueue_timeout secondes (contre-pression),
+    puis l'entrée est écrite directement par l'appelant
+    """
+
+    def __init__(self, queue_size=10000, batch_size=500, flush_interval=1.0, enqueue_timeout=0.5):
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.engine = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Démarre le thread au premier envoi (et après un fork du serveur)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, entries):
+        """Confie des entrées au thread d'écriture"""
+        self._ensure_started()
+        for index, entry in enumerate(entries):
+            try:
+                self.queue.put(entry, timeout=self.enqueue_timeout)
+            except queue.Full:
+                logger.warning('File du journal d\'activité pleine : écriture directe')
+                self.write_safely(entries[index:])
+                return
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is _STOP:
+                self.queue.task_done()
+                return
+            batch = [entry]
+            # Regroupe les entrées arrivées pendant flush_interval (au plus batch_size)
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self.write_safely(batch)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def write(self, entries):
+        """
+        Insère un lot d'entrées en une transaction (INSERT multi-lignes),
+        avec les compteurs, les agrégats horaires et journaliers et les événements
+        du flux temps réel
+        """
+        rows = [{key: value for key, value in entry.items() if key != 'username'} for entry in entries]
+        with Session(self.engine) as session:
+            session.execute(insert(ActivityLog), rows)
+            deltas, rollups = {}, {}
+            for row in rows:
+                count_change(deltas, ActivityLog, 1, row['user_id'])
+                rollup_change(rollups, row['action'], row['user_id'], row['created_at'])
+            adjust_counters(session, deltas)
+            adjust_rollups(session, rollups)
+            for entry in entries[-ACTIVITY_BROADCAST_LIMIT:]:
+                publish_after_commit(session, 'activity', activity_event(entry, entry.get('username')))
+            session.commit()
+
+    def write_safely(self, entries):
+        """
+        Écrit un lot sans jamais lever d'exception : un échec (interblocage, erreur
+        transitoire) est réessayé une fois, puis le lot est écrit entrée par entrée
+        pour ne perdre que les entrées réellement en erreur
+        """
+        for attempt in range(2):
+            try:
+                self.write(entries)
+                return
+            except Exception:
+                logger.warning('Écriture du journal d\'activité impossible (essai %d, %d entrées)',
+                               attempt + 1, len(entries), exc_info=True)
+        lost = 0
+        if len(entries) > 1:
+            for entry in entries:
+                try:
+                    self.write([entry])
+                except Exception:
+                    lost += 1
+        else:
+            lost = len(entries)
+        if lost:
+            logger.error('Journal d\'activité : %d entrée(s) perdue(s)', lost)
+
+    def flush(self, timeout=None):
+        """Attend que toutes les entrées en file soient écrites"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        if timeout is None:
+            self.queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stop(self, timeout=10):
+        """Écrit les entrées restantes puis arrête le thread (arrêt du processus)"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+activity_writer = ActivityWriter()
+atexit.register(activity_writer.stop)
+
+# ==================== API DES ROUTES ====================
+
+_async = True
+
+def _entry(action, description, user_id, username):
+    return {
+        'user_id': user_id,
+        'action': action,
+        'description': description,
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'created_at': datetime.utcnow(),
+        'username': username,
+    }
+
+def log_activities(action, descriptions, user=None):
+    """
+    Journalise plusieurs entrées d'une même action (utilisateur connecté par défaut)
+    Les entrées suivent la transaction en cours : rien n'est écrit si elle est annulée
+    """
+    if user is None and current_user and current_user.is_authenticated:
+        user = current_user
+    user_id = user.id if user is not None else None
+    username = user.username if user is not None else None
+    entries = [_entry(action, description, user_id, username) for description in descriptions]
+    if not entries:
+        return
+
+    session = db.session()
+    if not _async:
+        # Mode synchrone : mêmes transaction et commit que la modification journalisée
+        session.add_all(ActivityLog(**{key: value for key, value in entry.items() if key != 'username'})
+                        for entry in entries)
+    elif session.in_transaction():
+        session.info.setdefault('pending_activities', []).extend(entries)
+    else:
+        activity_writer.enqueue(entries)
+
+def log_activity(action, description, user=None):
+    """Journalise une action (voir log_activities)"""
+    log_activities(action, [description], user)
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_activities(session):
+    entries = session.info.pop('pending_activities', None)
+    if entries:
+        activity_writer.enqueue(entries)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_activities(session, transaction):
+    """Transaction annulée ou session fermée sans commit : les entrées sont abandonnées"""
+    if transaction.parent is None:
+        session.info.pop('pending_activities', None)
+
+def init_activity(app):
+    """
+    Configure l'écriture du journal : ACTIVITY_LOG_ASYNC (False pour les tests),
+    taille de file, taille des lots et délai maximal avant écriture
+    """
+    global _async
+    _async = app.config.get('ACTIVITY_LOG_ASYNC', True)
+    activity_writer.queue.maxsize = app.config.get('ACTIVITY_QUEUE_SIZE', 10000)
+    activity_writer.batch_size = app.config.get('ACTIVITY_BATCH_SIZE', 500)
+    activity_writer.flush_interval = app.config.get('ACTIVITY_FLUSH_INTERVAL', 1.0)
+    activity_writer.enqueue_timeout = app.config.get('ACTIVITY_ENQUEUE_TIMEOUT', 0.5)
+    with app.app_context():
+        activity_writer.engine = db.engine
+    return activity_writer
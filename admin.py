@@ -6,7 +6,8 @@ from flask import redirect, url_for, flash
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user
-from models import db, User, Product, FileUpload, Role, ActivityLog
+from models import db, User, Product, FileUpload, Role, ActivityLog, Category
+from counters import GLOBAL, get_counters
 
 class SecureAdminIndexView(AdminIndexView):
     """Vue d'index personnalisée avec protection admin"""
@@ -18,14 +19,15 @@ class SecureAdminIndexView(AdminIndexView):
             flash('Accès refusé. Vous devez être administrateur.', 'danger')
             return redirect(url_for('auth.login'))
         
-        # Statistiques pour le dashboard admin
+        # Statistiques pour le dashboard admin (compteurs précalculés)
+        counters = get_counters(GLOBAL)
         stats = {
-            'total_users': User.query.count(),
-            'total_products': Product.query.count(),
-            'total_uploads': FileUpload.query.count(),
-            'total_roles': Role.query.count(),
-            'active_users': User.query.filter_by(active=True).count(),
-            'inactive_users': User.query.filter_by(active=False).count(),
+            'total_users': counters['users'],
+            'total_products': counters['products'],
+            'total_uploads': counters['uploads'],
+            'total_roles': counters['roles'],
+            'active_users': counters['active_users'],
+            'inactive_users': counters['inactive_users'],
         }
         
         return self.render('admin/index.html', stats=stats)
@@ -112,6 +114,26 @@ class ProductAdminView(SecureModelView):
     
     page_size = 50
 
+class CategoryAdminView(SecureModelView):
+    """Vue admin pour les catégories (créées et comptées automatiquement)"""
+    
+    # Les catégories suivent les produits : lecture seule
+    can_create = False
+    can_edit = False
+    can_delete = False
+    
+    column_list = ['id', 'name', 'product_count', 'created_at']
+    column_searchable_list = ['name']
+    column_default_sort = 'name'
+    
+    column_labels = {
+        'name': 'Nom',
+        'product_count': 'Produits',
+        'created_at': 'Date de création'
+    }
+    
+    page_size = 50
+
 class FileUploadAdminView(SecureModelView):
     """Vue admin pour les fichiers uploadés"""
     
@@ -204,6 +226,7 @@ def init_admin(app):
     # Ajouter les vues admin
     admin.add_view(UserAdminView(User, db.session, name='Utilisateurs', category='Gestion'))
     admin.add_view(ProductAdminView(Product, db.session, name='Produits', category='Gestion'))
+    admin.add_view(CategoryAdminView(Category, db.session, name='Catégories', category='Gestion'))
     admin.add_view(FileUploadAdminView(FileUpload, db.session, name='Fichiers', category='Gestion'))
     admin.add_view(RoleAdminView(Role, db.session, name='Rôles', category='Sécurité'))
     admin.add_view(ActivityLogAdminView(ActivityLog, db.session, name='Logs d\'activité', category='Sécurité'))
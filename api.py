@@ -2,10 +2,29 @@
 API REST pour accéder aux données
 Fournit des endpoints JSON pour les opérations CRUD
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
-from models import db, Product, FileUpload, User, ActivityLog
+from werkzeug.http import is_resource_modified
+from sqlalchemy import insert, update, delete, select
+from sqlalchemy.orm import joinedload, load_only
+from models import db, Product, FileUpload, UploadSession, User, ActivityLog, CatalogVersion, CATALOG_VERSION_ID, get_catalog_version, bump_catalog_version, refresh_categories
+from pagination import keyset_page, keyset_filter
+from cache import product_cache, product_cache_key
+from streaming import STREAM_FORMATS, stream_response
+from serializers import json_response, product_serializer, upload_serializer, user_serializer
+from search import search_products
+from suggest import suggest_index
+from facets import get_facets, category_facet
+from counters import GLOBAL, adjust_counters, count_change, get_counters
+from query_stats import query_budget
+from broadcast import sse_response
+from activity import log_activity, log_activities
+from chunked_upload import abort_upload, append_chunk, complete_upload, create_upload_session, lock_upload
+from rollups import GRANULARITIES, MAX_BUCKETS, activity_series, bucket_count
 from functools import wraps
+from datetime import datetime, timedelta
+import hashlib
+import math
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -18,53 +37,260 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def not_modified(etag, last_modified=None):
+    """
+    Retourne une réponse 304 si le client possède déjà cette version
+    (If-None-Match / If-Modified-Since), sinon None
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return add_validators(current_app.response_class(status=304), etag, last_modified)
+
+def add_validators(response, etag, last_modified=None):
+    """Ajoute ETag et Last-Modified, et impose la revalidation côté client"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def requested_fields(model):
+    """
+    Analyse le paramètre fields= (liste séparée par des virgules)
+    Retourne None si absent, lève ValueError si un champ est inconnu
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in model.API_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f'Champs inconnus: {", ".join(unknown)}' if unknown else 'Champs requis')
+    return fields
+
+def project(query, model, fields, *always):
+    """
+    Limite le SELECT aux colonnes demandées (load_only)
+    always: colonnes chargées même si non demandées (ex: clé de tri du curseur)
+    La clé primaire est toujours chargée : fields peut ne citer que des relations (roles)
+    """
+    if fields is None:
+        return query
+    table_columns = model.__table__.columns
+    columns = [getattr(model, field) for field in fields if field in table_columns and field != 'id']
+    return query.options(load_only(model.id, *columns, *always))
+
+def listing_etag(version):
+    """ETag d'une liste : version du catalogue + paramètres de la requête"""
+    args = sorted(request.args.items(multi=True))
+    digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()[:16]
+    return f'c{version}-{digest}'
+
 # ==================== ENDPOINTS PRODUCTS ====================
 
 @api_bp.route('/products', methods=['GET'])
+@query_budget(4)
 def get_products():
     """
-    GET /api/products - Récupère tous les produits
-    Query params: category, min_price, max_price, limit
+    GET /api/products - Récupère les produits page par page
+    Query params: category, min_price, max_price, limit, cursor, format, fields
+    Les produits sont triés par (created_at, id) ; next_cursor permet
+    de demander la page suivante. format=ndjson ou format=stream exporte
+    tous les produits filtrés en flux continu, sans pagination.
+    fields=id,name,price limite les colonnes lues et les clés renvoyées
+    Répond 304 si le catalogue n'a pas changé depuis l'ETag fourni
     """
     try:
+        # Une lecture par clé primaire suffit à savoir si le client est à jour
+        version, last_modified = get_catalog_version()
+        etag = listing_etag(version)
+        cached = not_modified(etag, last_modified)
+        if cached is not None:
+            return cached
+        
         # Récupérer les paramètres de filtre
         category = request.args.get('category')
         min_price = request.args.get('min_price', type=float)
         max_price = request.args.get('max_price', type=float)
-        limit = request.args.get('limit', type=int)
+        limit = request.args.get('limit', type=int) or current_app.config['API_PAGE_SIZE']
+        limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+        cursor = request.args.get('cursor')
+        fmt = request.args.get('format')
+        try:
+            fields = requested_fields(Product)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Construction de la requête avec filtres
-        query = Product.query
+        # Construction de la requête avec filtres (lignes Core, sans objets ORM)
+        serializer = product_serializer(fields)
+        query = serializer.select()
         
         if category:
-            query = query.filter_by(category=category)
+            query = query.where(Product.category == category)
         if min_price is not None:
-            query = query.filter(Product.price >= min_price)
+            query = query.where(Product.price >= min_price)
         if max_price is not None:
-            query = query.filter(Product.price <= max_price)
-        if limit:
-            query = query.limit(limit)
+            query = query.where(Product.price <= max_price)
         
-        products = query.all()
+        # Export en flux : reprend éventuellement après le curseur fourni
+        if fmt in STREAM_FORMATS:
+            try:
+                query = keyset_filter(query, Product.created_at, Product.id, cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            response = stream_response(query, serializer.to_dict, 'products', fmt)
+            return add_validators(response, etag, last_modified)
         
-        return jsonify({
+        # Les pages fréquemment demandées sont servies depuis le cache mémoire
+        def load_page():
+            products, next_cursor = keyset_page(
+                query, Product.created_at, Product.id, limit, cursor
+            )
+            return serializer.serialize(products), next_cursor
+        
+        key = product_cache_key('api', category, min_price, max_price, limit, cursor, fields,
+                                version=version)
+        try:
+            products, next_cursor = product_cache.get_or_set(key, load_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = json_response({
             'success': True,
             'count': len(products),
-            'products': [product.to_dict() for product in products]
-        }), 200
+            'products': products,
+            'next_cursor': next_cursor
+        })
+        return add_validators(response, etag, last_modified)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/products/search', methods=['GET'])
+@query_budget(3)
+def search_products_api():
+    """
+    GET /api/products/search - Recherche plein texte classée par pertinence
+    Query params: q (requis), category, limit, fields
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Paramètre q requis'}), 400
+    
+    try:
+        fields = requested_fields(Product)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        limit = request.args.get('limit', type=int) or current_app.config['API_PAGE_SIZE']
+        limit = max(1, min(limit, current_app.config['SEARCH_MAX_RESULTS']))
+        category = request.args.get('category')
+        
+        # Sans filtre de catégorie, les premiers résultats suffisent
+        ranked = search_products(q, limit if not category else current_app.config['SEARCH_MAX_RESULTS'])
+        scores = dict(ranked)
+        
+        serializer = product_serializer(fields)
+        products = []
+        if scores:
+            query = serializer.select().where(Product.id.in_(scores))
+            if category:
+                query = query.where(Product.category == category)
+            rows = db.session.execute(query).all()
+            rows.sort(key=lambda row: (-scores[row.id], -row.id))
+            for row in rows[:limit]:
+                item = serializer.to_dict(row)
+                item['score'] = scores[row.id]
+                products.append(item)
+        
+        return json_response({
+            'success': True,
+            'count': len(products),
+            'products': products
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/products/suggest', methods=['GET'])
+@query_budget(2)
+def suggest_products():
+    """
+    GET /api/products/suggest - Autocomplétion des noms de produits et catégories
+    Query params: q (préfixe), limit (10 par défaut, 50 maximum)
+    Servi depuis l'index en mémoire, sans requête SQL
+    """
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    suggestions = suggest_index.suggest(request.args.get('q', ''), limit)
+    return json_response({
+        'success': True,
+        'suggestions': suggestions
+    })
+
+@api_bp.route('/products/facets', methods=['GET'])
+@query_budget(3)
+def get_product_facets():
+    """
+    GET /api/products/facets - Nombre de produits par catégorie et tranche de prix
+    Query params: search, category, min_price, max_price
+    Une seule requête GROUP BY, mise en cache par jeu de filtres
+    """
+    try:
+        facets = get_facets(
+            request.args.get('search') or None,
+            request.args.get('category') or None,
+            request.args.get('min_price', type=float),
+            request.args.get('max_price', type=float)
+        )
+        return json_response({
+            'success': True,
+            'facets': facets
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/products/<int:product_id>', methods=['GET'])
+@query_budget(3)
 def get_product(product_id):
-    """GET /api/products/<id> - Récupère un produit spécifique"""
+    """
+    GET /api/products/<id> - Récupère un produit spécifique
+    Query params: fields
+    Répond 304 si le produit n'a pas changé depuis l'ETag fourni
+    """
     try:
-        product = Product.query.get_or_404(product_id)
-        return jsonify({
+        fields = requested_fields(Product)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # Vérification légère : date de mise à jour du produit et version du catalogue
+        version = db.session.query(CatalogVersion.version).filter(
+            CatalogVersion.id == CATALOG_VERSION_ID
+        ).scalar_subquery()
+        row = db.session.query(Product.updated_at, version).filter(
+            Product.id == product_id
+        ).first()
+        if row is None:
+            return jsonify({'error': 'Produit introuvable'}), 404
+        
+        updated_at, catalog_version = row
+        stamp = updated_at.isoformat() if updated_at else ''
+        etag = hashlib.sha1(
+            f'{product_id}-{stamp}-{catalog_version}-{fields}'.encode('utf-8')
+        ).hexdigest()[:20]
+        cached = not_modified(etag, updated_at)
+        if cached is not None:
+            return cached
+        
+        product = project(Product.query, Product, fields).filter(
+            Product.id == product_id
+        ).first_or_404()
+        response = jsonify({
             'success': True,
-            'product': product.to_dict()
-        }), 200
+            'product': product.to_dict(fields)
+        })
+        return add_validators(response, etag, updated_at), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
@@ -91,16 +317,9 @@ def create_product():
         )
         
         db.session.add(product)
-        db.session.commit()
         
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=current_user.id,
-            action='create_product',
-            description=f'Produit créé: {product.name}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec la modification
+        log_activity('create_product', f'Produit créé: {product.name}')
         db.session.commit()
         
         return jsonify({
@@ -140,16 +359,8 @@ def update_product(product_id):
         if 'image_url' in data:
             product.image_url = data['image_url']
         
-        db.session.commit()
-        
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=current_user.id,
-            action='update_product',
-            description=f'Produit mis à jour: {product.name}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec la modification
+        log_activity('update_product', f'Produit mis à jour: {product.name}')
         db.session.commit()
         
         return jsonify({
@@ -175,16 +386,9 @@ def delete_product(product_id):
         
         product_name = product.name
         db.session.delete(product)
-        db.session.commit()
         
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=current_user.id,
-            action='delete_product',
-            description=f'Produit supprimé: {product_name}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec la modification
+        log_activity('delete_product', f'Produit supprimé: {product_name}')
         db.session.commit()
         
         return jsonify({
@@ -196,95 +400,524 @@ def delete_product(product_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# ==================== ENDPOINTS PRODUCTS (LOT) ====================
+
+def _text_field(max_length, required=False):
+    """Convertisseur d'un champ texte : chaîne d'au plus max_length caractères, non vide si requise"""
+    def convert(value):
+        if value is None and not required:
+            return ''
+        if not isinstance(value, str) or (required and not value.strip()):
+            raise ValueError
+        if max_length and len(value) > max_length:
+            raise ValueError
+        return value
+    return convert
+
+def _number_field(kind):
+    """Convertisseur d'un champ numérique positif ou nul (booléens, objets et NaN refusés)"""
+    def convert(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError
+        if kind is int and isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        number = kind(value)
+        if not math.isfinite(number) or number < 0:
+            raise ValueError
+        return number
+    return convert
+
+# Champs modifiables d'un produit et fonction de validation associée
+# (mêmes règles que le formulaire produit, prix et stock positifs ou nuls)
+PRODUCT_FIELDS = {
+    'name': _text_field(100, required=True),
+    'description': _text_field(None),
+    'price': _number_field(float),
+    'stock': _number_field(int),
+    'category': _text_field(50),
+    'image_url': _text_field(200),
+}
+
+def _bulk_items(data, key):
+    """Extrait la liste d'éléments du corps de la requête (liste brute ou {key: [...]})"""
+    items = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'Liste "{key}" requise')
+    max_items = current_app.config['API_BULK_MAX_ITEMS']
+    if len(items) > max_items:
+        raise ValueError(f'Maximum {max_items} éléments par requête')
+    return items
+
+def _is_id(value):
+    """Identifiant entier (les booléens JSON, sous-classe de int, sont refusés)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _clean_fields(item):
+    """Convertit les champs modifiables d'un élément, lève ValueError si invalide"""
+    values = {}
+    for field, convert in PRODUCT_FIELDS.items():
+        if field in item:
+            try:
+                values[field] = convert(item[field])
+            except (TypeError, ValueError):
+                raise ValueError(f'Valeur invalide pour "{field}"')
+    return values
+
+def _duplicate_result(index, product_id, first):
+    """Résultat d'un identifiant déjà présent plus haut dans la requête (à l'index first)"""
+    return {'index': index, 'id': product_id, 'status': 'duplicate', 'duplicate_of': first}
+
+def _product_owners(product_ids):
+    """Retourne {id: user_id} pour les produits existants, par lots de 1000"""
+    owners = {}
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), 1000):
+        chunk = product_ids[start:start + 1000]
+        owners.update(db.session.query(Product.id, Product.user_id).filter(
+            Product.id.in_(chunk)
+        ).all())
+    return owners
+
+def _product_categories(product_ids):
+    """Catégories actuelles des produits donnés, par lots de 1000"""
+    categories = set()
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), 1000):
+        chunk = product_ids[start:start + 1000]
+        categories.update(db.session.scalars(
+            select(Product.category).where(Product.id.in_(chunk)).distinct()
+        ))
+    return categories
+
+def _check_owned(items, owners):
+    """
+    Sépare les éléments autorisés des refusés selon la règle propriétaire/admin
+    Retourne (autorisés [(index, id, item)], erreurs [résultat])
+    """
+    is_admin = current_user.has_role('admin')
+    allowed, errors = [], []
+    for index, product_id, item in items:
+        if product_id not in owners:
+            errors.append({'index': index, 'id': product_id, 'status': 'error',
+                           'error': 'Produit introuvable'})
+        elif owners[product_id] != current_user.id and not is_admin:
+            errors.append({'index': index, 'id': product_id, 'status': 'error',
+                           'error': 'Accès non autorisé'})
+        else:
+            allowed.append((index, product_id, item))
+    return allowed, errors
+
+def _bulk_response(results):
+    """
+    Réponse commune : résultats par élément triés dans l'ordre de la requête
+    Un doublon prend l'issue de sa première occurrence : applied + failed = nombre d'éléments
+    """
+    results.sort(key=lambda result: result['index'])
+    statuses = {result['index']: result['status'] for result in results}
+    failed = sum(1 for result in results if result['status'] == 'error' or (
+        result['status'] == 'duplicate' and statuses.get(result['duplicate_of']) == 'error'
+    ))
+    return jsonify({
+        'success': failed == 0,
+        'applied': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }), 200
+
+@api_bp.route('/products/bulk', methods=['POST'])
+@login_required
+def bulk_create_products():
+    """
+    POST /api/products/bulk - Crée plusieurs produits en une transaction
+    Corps: {"products": [{"name", "price", ...}, ...]}
+    """
+    try:
+        items = _bulk_items(request.get_json(silent=True), 'products')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        results, rows = [], []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict) or 'name' not in item or 'price' not in item:
+                    raise ValueError('Nom et prix requis')
+                values = _clean_fields(item)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'error', 'error': str(e)})
+                continue
+            values.setdefault('description', '')
+            values.setdefault('stock', 0)
+            values.setdefault('category', '')
+            values.setdefault('image_url', '')
+            values['user_id'] = current_user.id
+            rows.append((index, values))
+        
+        if rows:
+            stmt = insert(Product)
+            dialect = db.session.get_bind().dialect
+            if dialect.insert_executemany_returning_sort_by_parameter_order:
+                # Les identifiants sont renvoyés dans l'ordre des lignes envoyées
+                stmt = stmt.returning(Product.id, sort_by_parameter_order=True)
+                new_ids = db.session.scalars(stmt, [values for _, values in rows]).all()
+            else:
+                # MySQL ne supporte pas RETURNING : INSERT multi-lignes sans identifiants
+                db.session.execute(stmt, [values for _, values in rows])
+                new_ids = [None] * len(rows)
+            
+            for (index, values), product_id in zip(rows, new_ids):
+                results.append({'index': index, 'id': product_id, 'status': 'created'})
+            
+            refresh_categories(db.session, {values['category'] for _, values in rows})
+            deltas = {}
+            count_change(deltas, Product, len(rows), current_user.id)
+            adjust_counters(db.session, deltas)
+            log_activities('create_product', [f'Produit créé: {values["name"]}' for _, values in rows])
+            bump_catalog_version(db.session)
+        
+        db.session.commit()
+        return _bulk_response(results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/products/bulk', methods=['PATCH'])
+@login_required
+def bulk_update_products():
+    """
+    PATCH /api/products/bulk - Met à jour plusieurs produits en une transaction
+    Corps: {"products": [{"id", champs à modifier...}, ...]}
+    """
+    try:
+        items = _bulk_items(request.get_json(silent=True), 'products')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        results, candidates, seen = [], [], {}
+        for index, item in enumerate(items):
+            product_id = item.get('id') if isinstance(item, dict) else None
+            if not _is_id(product_id):
+                results.append({'index': index, 'status': 'error', 'error': 'Identifiant requis'})
+                continue
+            # Un identifiant répété n'est modifié qu'une fois : seule sa première occurrence s'applique
+            if product_id in seen:
+                results.append(_duplicate_result(index, product_id, seen[product_id]))
+                continue
+            seen[product_id] = index
+            candidates.append((index, product_id, item))
+        
+        allowed, errors = _check_owned(candidates, _product_owners(pid for _, pid, _ in candidates))
+        results.extend(errors)
+        
+        now = datetime.utcnow()
+        rows, descriptions = [], []
+        for index, product_id, item in allowed:
+            try:
+                values = _clean_fields(item)
+            except ValueError as e:
+                results.append({'index': index, 'id': product_id, 'status': 'error', 'error': str(e)})
+                continue
+            values['id'] = product_id
+            values['updated_at'] = now
+            rows.append(values)
+            results.append({'index': index, 'id': product_id, 'status': 'updated'})
+            descriptions.append(f'Produit mis à jour: {values.get("name", product_id)}')
+        
+        if rows:
+            # Catégories quittées par les produits recatégorisés (compteurs à recalculer)
+            recategorized = [values for values in rows if 'category' in values]
+            categories = _product_categories(values['id'] for values in recategorized)
+            categories.update(values['category'] for values in recategorized)
+            
+            # UPDATE ensembliste par clé primaire (regroupé par jeu de colonnes)
+            db.session.execute(update(Product), rows)
+            if categories:
+                refresh_categories(db.session, categories)
+            log_activities('update_product', descriptions)
+            bump_catalog_version(db.session)
+        
+        db.session.commit()
+        return _bulk_response(results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/products/bulk', methods=['DELETE'])
+@login_required
+def bulk_delete_products():
+    """
+    DELETE /api/products/bulk - Supprime plusieurs produits en une transaction
+    Corps: {"ids": [1, 2, ...]}
+    """
+    try:
+        product_ids = _bulk_items(request.get_json(silent=True), 'ids')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        results, candidates, seen = [], [], {}
+        for index, product_id in enumerate(product_ids):
+            if not _is_id(product_id):
+                results.append({'index': index, 'status': 'error', 'error': 'Identifiant requis'})
+                continue
+            # Un identifiant répété n'est supprimé (et journalisé) qu'une fois
+            if product_id in seen:
+                results.append(_duplicate_result(index, product_id, seen[product_id]))
+                continue
+            seen[product_id] = index
+            candidates.append((index, product_id, None))
+        
+        owners = _product_owners(pid for _, pid, _ in candidates)
+        allowed, errors = _check_owned(candidates, owners)
+        results.extend(errors)
+        
+        ids = [product_id for _, product_id, _ in allowed]
+        if ids:
+            names, categories = {}, set()
+            for product_id, name, category in db.session.query(
+                Product.id, Product.name, Product.category
+            ).filter(Product.id.in_(ids)):
+                names[product_id] = name
+                categories.add(category)
+            for start in range(0, len(ids), 1000):
+                db.session.execute(
+                    delete(Product).where(Product.id.in_(ids[start:start + 1000])),
+                    execution_options={'synchronize_session': False}
+                )
+            refresh_categories(db.session, categories)
+            deltas = {}
+            for product_id in ids:
+                count_change(deltas, Product, -1, owners[product_id])
+            adjust_counters(db.session, deltas)
+            log_activities('delete_product', [f'Produit supprimé: {names[pid]}' for pid in ids])
+            bump_catalog_version(db.session)
+        
+        results.extend({'index': index, 'id': product_id, 'status': 'deleted'}
+                       for index, product_id, _ in allowed)
+        
+        db.session.commit()
+        return _bulk_response(results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 # ==================== ENDPOINTS USERS ====================
 
 @api_bp.route('/users', methods=['GET'])
 @login_required
 @admin_required
+@query_budget(4)
 def get_users():
-    """GET /api/users - Récupère tous les utilisateurs (admin seulement)"""
+    """
+    GET /api/users - Récupère tous les utilisateurs (admin seulement)
+    Query params: fields
+    """
     try:
-        users = User.query.all()
-        return jsonify({
+        fields = requested_fields(User)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        serializer = user_serializer(fields)
+        users = serializer.serialize(db.session.execute(serializer.select()).all())
+        return json_response({
             'success': True,
             'count': len(users),
-            'users': [{
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'active': user.active,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'roles': [role.name for role in user.roles]
-            } for user in users]
-        }), 200
+            'users': users
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/users/<int:user_id>', methods=['GET'])
 @login_required
 def get_user(user_id):
-    """GET /api/users/<id> - Récupère un utilisateur spécifique"""
+    """
+    GET /api/users/<id> - Récupère un utilisateur spécifique
+    Query params: fields
+    """
     try:
-        # L'utilisateur peut voir son propre profil, admin peut voir tous
-        if current_user.id != user_id and not current_user.has_role('admin'):
-            return jsonify({'error': 'Accès non autorisé'}), 403
-        
-        user = User.query.get_or_404(user_id)
-        return jsonify({
-            'success': True,
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'active': user.active,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'roles': [role.name for role in user.roles]
-            }
-        }), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 404
+        fields = requested_fields(User)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # L'utilisateur peut voir son propre profil, admin peut voir tous
+    if current_user.id != user_id and not current_user.has_role('admin'):
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    
+    user = project(User.query, User, fields).filter(User.id == user_id).first()
+    if user is None:
+        return jsonify({'error': 'Utilisateur introuvable'}), 404
+    return jsonify({
+        'success': True,
+        'user': user.to_dict(fields)
+    }), 200
 
 # ==================== ENDPOINTS UPLOADS ====================
 
 @api_bp.route('/uploads', methods=['GET'])
 @login_required
+@query_budget(3)
 def get_uploads():
-    """GET /api/uploads - Récupère les fichiers de l'utilisateur"""
+    """
+    GET /api/uploads - Récupère les fichiers de l'utilisateur
+    Query params: format (ndjson ou stream pour un export en flux continu), fields
+    """
     try:
-        if current_user.has_role('admin'):
-            uploads = FileUpload.query.all()
-        else:
-            uploads = FileUpload.query.filter_by(user_id=current_user.id).all()
+        fields = requested_fields(FileUpload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        serializer = upload_serializer(fields)
+        query = serializer.select()
+        if not current_user.has_role('admin'):
+            query = query.where(FileUpload.user_id == current_user.id)
         
-        return jsonify({
+        fmt = request.args.get('format')
+        if fmt in STREAM_FORMATS:
+            query = query.order_by(FileUpload.id)
+            return stream_response(query, serializer.to_dict, 'uploads', fmt)
+        
+        uploads = serializer.serialize(db.session.execute(query).all())
+        
+        return json_response({
             'success': True,
             'count': len(uploads),
-            'uploads': [upload.to_dict() for upload in uploads]
-        }), 200
+            'uploads': uploads
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _upload_session_or_error(session_id):
+    """Session d'upload de l'utilisateur connecté, ou (None, réponse d'erreur)"""
+    upload = db.session.get(UploadSession, session_id)
+    if upload is None:
+        return None, (jsonify({'error': 'Session d\'upload introuvable'}), 404)
+    if upload.user_id != current_user.id:
+        return None, (jsonify({'error': 'Accès non autorisé'}), 403)
+    return upload, None
+
+@api_bp.route('/uploads/sessions', methods=['POST'])
+@login_required
+def create_upload():
+    """
+    POST /api/uploads/sessions - Démarre un upload par morceaux
+    Body JSON: filename, size (octets), mime_type
+    Réponse: id de session, offset (0) et taille maximale d'un morceau
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = create_upload_session(
+            current_user, data.get('filename'), data.get('size'), data.get('mime_type')
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'upload': upload.to_dict(),
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']
+    }), 201
+
+@api_bp.route('/uploads/sessions/<session_id>', methods=['GET'])
+@login_required
+def get_upload(session_id):
+    """GET /api/uploads/sessions/<id> - Offset atteint, pour reprendre après une coupure"""
+    upload, error = _upload_session_or_error(session_id)
+    if error:
+        return error
+    return jsonify({'success': True, 'upload': upload.to_dict()}), 200
+
+@api_bp.route('/uploads/sessions/<session_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(session_id):
+    """
+    PUT /api/uploads/sessions/<id>?offset=N - Envoie un morceau (corps brut)
+    offset doit valoir le nombre d'octets déjà reçus, sinon 409 avec l'offset attendu
+    """
+    upload, error = _upload_session_or_error(session_id)
+    if error:
+        return error
+    # Ligne verrouillée jusqu'au commit : un seul morceau à la fois par session,
+    # tous workers confondus, et seulement à l'offset attendu
+    offset = request.args.get('offset', type=int)
+    if offset is None or not lock_upload(upload, offset):
+        db.session.rollback()
+        upload, error = _upload_session_or_error(session_id)
+        if error:
+            return error
+        return jsonify({'error': 'Offset inattendu', 'offset': upload.received}), 409
+    try:
+        append_chunk(upload, request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'offset': upload.received}), 400
+    finally:
+        # Octets écrits enregistrés même en cas d'erreur ou de connexion coupée
+        db.session.commit()
+    return jsonify({'success': True, 'upload': upload.to_dict()}), 200
+
+@api_bp.route('/uploads/sessions/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload_session(session_id):
+    """
+    POST /api/uploads/sessions/<id>/complete - Termine l'upload
+    Body JSON optionnel: sha256 (vérifié contre l'empreinte calculée à l'écriture)
+    """
+    upload, error = _upload_session_or_error(session_id)
+    if error:
+        return error
+    if not lock_upload(upload):
+        return jsonify({'error': 'Session d\'upload introuvable'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        file_upload = complete_upload(upload, data.get('sha256'))
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'offset': upload.received}), 400
+    log_activity('upload_file', f'Fichier uploadé: {file_upload.original_filename}')
+    db.session.commit()
+    return jsonify({'success': True, 'upload': file_upload.to_dict()}), 201
+
+@api_bp.route('/uploads/sessions/<session_id>', methods=['DELETE'])
+@login_required
+def abort_upload_session(session_id):
+    """DELETE /api/uploads/sessions/<id> - Abandonne l'upload et supprime le fichier partiel"""
+    upload, error = _upload_session_or_error(session_id)
+    if error:
+        return error
+    if not lock_upload(upload):
+        return jsonify({'error': 'Session d\'upload introuvable'}), 404
+    abort_upload(upload)
+    db.session.commit()
+    return jsonify({'success': True}), 200
+
 # ==================== ENDPOINTS STATISTIQUES ====================
 
 @api_bp.route('/stats/dashboard', methods=['GET'])
 @login_required
+@query_budget(5)
 def get_dashboard_stats():
     """GET /api/stats/dashboard - Récupère les statistiques pour le dashboard"""
     try:
+        # Compteurs précalculés (une lecture par clé primaire)
+        counters = get_counters(GLOBAL)
         stats = {
-            'total_users': User.query.count(),
-            'total_products': Product.query.count(),
-            'total_uploads': FileUpload.query.count(),
-            'total_activities': ActivityLog.query.count(),
+            'total_users': counters['users'],
+            'total_products': counters['products'],
+            'total_uploads': counters['uploads'],
+            'total_activities': counters['activities'],
             'recent_activities': []
         }
         
         # Récupérer les activités récentes
-        recent_logs = ActivityLog.query.order_by(ActivityLog.created_at.desc()).limit(10).all()
+        recent_logs = ActivityLog.query.options(joinedload(ActivityLog.user)).order_by(
+            ActivityLog.created_at.desc()
+        ).limit(10).all()
         stats['recent_activities'] = [{
             'id': log.id,
             'action': log.action,
@@ -293,14 +926,10 @@ def get_dashboard_stats():
             'user': log.user.username if log.user else 'System'
         } for log in recent_logs]
         
-        # Statistiques par catégorie de produits
-        from sqlalchemy import func
-        category_stats = db.session.query(
-            Product.category,
-            func.count(Product.id).label('count')
-        ).group_by(Product.category).all()
-        
-        stats['products_by_category'] = {cat: count for cat, count in category_stats if cat}
+        # Statistiques par catégorie de produits (compteurs de la table Category)
+        stats['products_by_category'] = {
+            facet['value']: facet['count'] for facet in category_facet()
+        }
         
         return jsonify({
             'success': True,
@@ -310,8 +939,60 @@ def get_dashboard_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Période par défaut d'une série selon la granularité
+ACTIVITY_SERIES_DEFAULT_SPAN = {'hour': timedelta(hours=24), 'day': timedelta(days=30)}
+
+@api_bp.route('/stats/activity', methods=['GET'])
+@login_required
+@query_budget(3)
+def get_activity_stats():
+    """
+    GET /api/stats/activity - Série temporelle des activités, lue dans les agrégats
+    Paramètres: interval (hour|day), action, from / to (ISO 8601, to exclu),
+    user_id (admin ; les autres utilisateurs ne voient que leurs activités)
+    """
+    interval = request.args.get('interval', 'day')
+    if interval not in GRANULARITIES:
+        return jsonify({'error': f'interval doit valoir {" ou ".join(GRANULARITIES)}'}), 400
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - ACTIVITY_SERIES_DEFAULT_SPAN[interval])
+    except ValueError:
+        return jsonify({'error': 'Dates from / to invalides (format ISO 8601 attendu)'}), 400
+    if bucket_count(interval, start, end) > MAX_BUCKETS:
+        return jsonify({'error': f'Période trop longue : {MAX_BUCKETS} intervalles au maximum'}), 400
+
+    user_id = request.args.get('user_id', type=int)
+    if not current_user.has_role('admin'):
+        user_id = current_user.id
+    action = request.args.get('action')
+
+    series = activity_series(interval, start, end, action, user_id)
+    return json_response({
+        'success': True,
+        'interval': interval,
+        'action': action,
+        'user_id': user_id,
+        'from': start,
+        'to': end,
+        'total': sum(count for _, count in series),
+        'series': [{'bucket': bucket, 'count': count} for bucket, count in series]
+    })
+
 # ==================== ENDPOINT TEST ====================
 
+@api_bp.route('/stream/activity', methods=['GET'])
+@login_required
+def stream_activity():
+    """
+    GET /api/stream/activity - Flux Server-Sent Events
+    Événements "activity" (nouvelle entrée du journal) et "counters" (variations des
+    compteurs globaux et personnels), poussés dès le commit au lieu d'interroger
+    /api/stats/dashboard
+    """
+    return sse_response(current_user.id)
+
 @api_bp.route('/ping', methods=['GET'])
 def ping():
     """GET /api/ping - Endpoint de test"""
@@ -13,6 +13,14 @@ from api import api_bp
 from routes_auth import auth_bp
 from routes_main import main_bp
 from admin import init_admin
+from cache import init_cache
+from fragment_cache import init_fragment_cache
+from principal import init_principal, load_principal
+from query_stats import init_query_stats
+from broadcast import init_broadcast
+from activity import init_activity
+from suggest import init_suggest
+from commands import init_commands
 
 def create_app(config_name='default'):
     """Factory pour créer l'application Flask"""
@@ -24,6 +32,13 @@ def create_app(config_name='default'):
     
     # Initialiser les extensions
     db.init_app(app)
+    init_cache(app)
+    init_fragment_cache(app)
+    init_principal(app)
+    init_query_stats(app)
+    init_broadcast(app)
+    init_activity(app)
+    init_suggest(app)
     
     # Initialiser la protection CSRF
     csrf = CSRFProtect(app)
@@ -37,8 +52,8 @@ def create_app(config_name='default'):
     
     @login_manager.user_loader
     def load_user(user_id):
-        """Charge l'utilisateur depuis la base de données"""
-        return User.query.get(int(user_id))
+        """Charge l'utilisateur et ses rôles (une requête, ou le cache des principaux)"""
+        return load_principal(int(user_id))
     
     # Configuration Flask-Talisman pour la sécurité HTTP
     # Note: désactivé en développement, activé en production
@@ -94,12 +109,17 @@ def create_app(config_name='default'):
         }
     
     # Commandes CLI personnalisées
+    init_commands(app)
+    
     @app.cli.command()
     def init_db():
         """Initialise la base de données"""
         from models import Role
+        from schema import upgrade_schema
         
-        db.create_all()
+        # Tables, colonnes et index manquants, structures complémentaires
+        # (recherche plein texte, compteurs initialisés depuis les données existantes)
+        upgrade_schema()
         
         # Créer les rôles par défaut si ils n'existent pas
         roles = ['admin', 'user', 'moderator']
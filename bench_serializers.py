@@ -0,0 +1,76 @@
+"""
+Micro-benchmark de la sérialisation des produits
+Compare l'ancien chemin (objets ORM + to_dict + json) au sérialiseur de lignes Core
+Usage: python bench_serializers.py [nombre_de_lignes]
+"""
+import json
+import sys
+import time
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import insert
+from models import db, Product, User
+from serializers import dumps, orjson, product_serializer
+
+def build_app(rows):
+    """Application minimale sur une base SQLite en mémoire remplie de produits"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        db.session.execute(insert(Product), [{
+            'name': f'Produit {i}',
+            'description': 'Description du produit ' * 5,
+            'price': i * 0.5,
+            'stock': i % 100,
+            'category': f'Catégorie {i % 20}',
+            'image_url': f'https://example.com/{i}.png',
+            'created_at': now,
+            'updated_at': now,
+            'user_id': user.id
+        } for i in range(rows)])
+        db.session.commit()
+
+    return app
+
+def orm_to_dict():
+    """Ancien chemin : hydratation ORM, to_dict() par objet, json standard"""
+    products = Product.query.all()
+    body = json.dumps({'products': [product.to_dict() for product in products]})
+    db.session.expunge_all()
+    return len(products), len(body)
+
+def core_rows():
+    """Nouveau chemin : tuples Core, dictionnaires zippés, encodeur rapide"""
+    serializer = product_serializer()
+    rows = db.session.execute(serializer.select()).all()
+    body = dumps({'products': serializer.serialize(rows)})
+    return len(rows), len(body)
+
+def measure(label, func, repeat=3):
+    """Exécute func plusieurs fois et affiche le meilleur débit obtenu"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count, size = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<32} {count / best:>12,.0f} lignes/s  ({best * 1000:.0f} ms, {size / 1e6:.1f} Mo)')
+    return count / best
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    app = build_app(rows)
+
+    print(f'{rows} produits, encodeur: {"orjson" if orjson else "json (stdlib)"}')
+    with app.app_context():
+        before = measure('ORM + to_dict() + json', orm_to_dict)
+        after = measure('Lignes Core + sérialiseur', core_rows)
+    print(f'Gain: x{after / before:.1f}')
@@ -0,0 +1,149 @@
+"""
+Diffusion en temps réel des activités et des compteurs (Server-Sent Events)
+Un diffuseur par worker : chaque transaction validée publie ses événements une
+seule fois, et chaque connexion SSE ouverte les reçoit depuis sa propre file
+"""
+import itertools
+import queue
+import threading
+from flask import Response, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import ActivityLog, User
+from serializers import dumps
+
+# Nombre maximal d'entrées d'un lot du journal diffusées sur le flux
+ACTIVITY_BROADCAST_LIMIT = 10
+
+class Subscription:
+    """File d'événements d'une connexion SSE"""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+class Broadcaster:
+    """
+    Répartit les événements publiés entre les abonnés du worker
+    Un abonné trop lent (file pleine) est déconnecté ; le navigateur se reconnecte
+    """
+
+    def __init__(self, queue_size=100):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self.queue_size = queue_size
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_name, data):
+        """Envoie (id, événement, données) à tous les abonnés, sans jamais bloquer"""
+        message = (next(self._ids), event_name, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                self.unsubscribe(subscription)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+broadcaster = Broadcaster()
+
+# ==================== ÉVÉNEMENTS DES TRANSACTIONS ====================
+
+def publish_after_commit(session, event_name, data):
+    """Met un événement en attente ; il n'est diffusé que si la transaction est validée"""
+    session.info.setdefault('broadcast_events', []).append((event_name, data))
+
+def activity_event(log, username=None):
+    """Représentation d'une entrée du journal pour le flux (mêmes champs que /api/stats/dashboard)"""
+    return {
+        'id': log.get('id'),
+        'action': log['action'],
+        'description': log.get('description'),
+        'created_at': log['created_at'].isoformat() if log.get('created_at') else None,
+        'user_id': log.get('user_id'),
+        'user': username or 'System'
+    }
+
+def _username(session, user_id):
+    """Nom de l'utilisateur s'il est déjà chargé dans la session (aucune requête)"""
+    if user_id is None:
+        return None
+    user = session.identity_map.get(session.identity_key(User, user_id))
+    return user.username if user is not None else f'#{user_id}'
+
+@event.listens_for(Session, 'after_flush')
+def _collect_activities(session, flush_context):
+    """Nouvelles entrées du journal d'activité écrites par l'ORM"""
+    for obj in session.new:
+        if isinstance(obj, ActivityLog):
+            publish_after_commit(session, 'activity', activity_event({
+                'id': obj.id, 'action': obj.action, 'description': obj.description,
+                'created_at': obj.created_at, 'user_id': obj.user_id
+            }, _username(session, obj.user_id)))
+
+@event.listens_for(Session, 'after_commit')
+def _publish_events(session):
+    for event_name, data in session.info.pop('broadcast_events', ()):
+        broadcaster.publish(event_name, data)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('broadcast_events', None)
+
+# ==================== RÉPONSE SSE ====================
+
+def _visible(subscription, event_name, data):
+    """Les compteurs personnels ne sont envoyés qu'à leur propriétaire"""
+    if event_name == 'counters' and data['user_id']:
+        return data['user_id'] == subscription.user_id
+    return True
+
+def sse_response(user_id):
+    """
+    Réponse text/event-stream abonnée au diffuseur du worker
+    Un commentaire est envoyé toutes les SSE_KEEPALIVE secondes pour garder la connexion
+    """
+    keepalive = current_app.config.get('SSE_KEEPALIVE', 15)
+    subscription = broadcaster.subscribe(user_id)
+
+    def generate():
+        try:
+            yield b'retry: 5000\n\n'
+            while not subscription.closed:
+                try:
+                    event_id, event_name, data = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+                    continue
+                if _visible(subscription, event_name, data):
+                    yield b'id: %d\nevent: %s\ndata: %s\n\n' % (
+                        event_id, event_name.encode('ascii'), dumps(data)
+                    )
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Pas de mise en tampon par un proxy nginx : chaque événement part immédiatement
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def init_broadcast(app):
+    """Configure la taille des files d'abonnés depuis la configuration"""
+    broadcaster.queue_size = app.config.get('SSE_QUEUE_SIZE', 100)
+    return broadcaster
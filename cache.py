@@ -0,0 +1,91 @@
+"""
+Cache mémoire des résultats de listes de produits
+Cache LRU borné avec expiration (TTL), invalidé à chaque écriture sur le catalogue
+"""
+import threading
+import time
+from collections import OrderedDict
+from models import catalog_changed
+
+_MISSING = object()
+
+class TTLCache:
+    """Cache LRU de taille bornée dont les entrées expirent après ttl secondes"""
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Retourne la valeur associée à la clé si elle est présente et non expirée"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Ajoute une entrée en évinçant la moins récemment utilisée si nécessaire"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Retourne la valeur en cache ou la calcule avec factory() et la mémorise"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        """Supprime une entrée"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Vide le cache"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# Résultats des listes de produits (API et page HTML), indexés par filtres normalisés
+product_cache = TTLCache()
+
+def product_cache_key(*filters, version):
+    """
+    Clé d'une liste de produits à partir des filtres déjà typés (None si absent)
+    La version du catalogue fait partie de la clé : un autre worker ayant modifié
+    le catalogue rend automatiquement les entrées obsolètes inaccessibles
+    """
+    return (version,) + tuple(value if value != '' else None for value in filters)
+
+@catalog_changed.connect
+def _invalidate_product_cache(sender, **kwargs):
+    """Vide le cache dès qu'une transaction a modifié un produit"""
+    product_cache.clear()
+
+def init_cache(app):
+    """Configure la taille et la durée de vie du cache depuis la configuration"""
+    product_cache.maxsize = app.config.get('PRODUCT_CACHE_SIZE', 256)
+    product_cache.ttl = app.config.get('PRODUCT_CACHE_TTL', 60)
+    return product_cache
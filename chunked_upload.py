@@ -0,0 +1,211 @@
+"""
+Upload de fichiers par morceaux, avec reprise
+Protocole : création d'une session (nom, taille), envoi des morceaux (PUT à un offset),
+finalisation. Chaque morceau est écrit directement à la suite du fichier partiel et le
+SHA-256 est calculé au fil de l'écriture ; après une coupure, le client relit l'offset
+reçu et reprend à partir de là. Le fichier complet est rangé dans le stockage par
+contenu (voir storage.py).
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from werkzeug.utils import secure_filename
+from models import db, UploadSession
+from storage import store_upload, temp_path
+
+# Taille des blocs lus sur la requête et écrits sur le disque
+COPY_BUFFER_SIZE = 64 * 1024
+
+def allowed_file(filename):
+    """Extension autorisée par ALLOWED_EXTENSIONS"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension in current_app.config['ALLOWED_EXTENSIONS']
+
+def unique_filename(filename):
+    """Nom unique d'une session : horodatage + nom sécurisé"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{secure_filename(filename)}"
+
+def iter_blocks(stream, limit):
+    """
+    Blocs lus sur stream jusqu'à sa fin
+    Lève ValueError dès que plus de limit octets ont été envoyés
+    """
+    total = 0
+    while True:
+        block = stream.read(COPY_BUFFER_SIZE)
+        if not block:
+            return
+        total += len(block)
+        if total > limit:
+            raise ValueError(f'Le morceau dépasse la taille attendue ({limit} octets au plus)')
+        yield block
+
+def save_stream(stream, path, limit):
+    """
+    Écrit stream dans path en une seule copie, en calculant le SHA-256 au passage
+    Retourne (taille, sha256 hexadécimal)
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as target:
+        for block in iter_blocks(stream, limit):
+            target.write(block)
+            hasher.update(block)
+            size += len(block)
+    return size, hasher.hexdigest()
+
+# ==================== ÉTAT DU HACHAGE ====================
+
+# SHA-256 en cours par session : {id: (octets hachés, objet hashlib, dernier usage)}
+# Propre au worker ; un autre worker (ou un redémarrage) relit le fichier partiel
+_hash_states = {}
+_hash_lock = threading.Lock()
+
+# Durée après laquelle l'état d'une session inactive est libéré (la purge des sessions
+# abandonnées s'exécute dans un autre processus) ; une reprise tardive relit le fichier
+HASH_STATE_IDLE = 3600
+
+def _remember(session_id, received, hasher):
+    """Mémorise l'état du hachage et libère ceux des sessions inactives"""
+    now = time.monotonic()
+    with _hash_lock:
+        _hash_states[session_id] = (received, hasher, now)
+        idle = [key for key, state in _hash_states.items() if now - state[2] > HASH_STATE_IDLE]
+        for key in idle:
+            del _hash_states[key]
+
+def _forget(session_id):
+    with _hash_lock:
+        _hash_states.pop(session_id, None)
+
+def lock_upload(upload, offset=None):
+    """
+    Verrouille la ligne de la session jusqu'à la fin de la transaction, pour tous les
+    workers : UPDATE conditionnel (verrou de ligne InnoDB, verrou d'écriture SQLite)
+    Avec offset, le verrou n'est pris que si les octets reçus valent toujours offset
+    Retourne False si la session a disparu ou si l'offset ne correspond plus
+    """
+    table = UploadSession.__table__
+    conditions = [table.c.id == upload.id]
+    if offset is not None:
+        conditions.append(table.c.received == offset)
+    result = db.session.execute(update(table).where(*conditions).values(updated_at=datetime.utcnow()))
+    if not result.rowcount:
+        return False
+    db.session.refresh(upload)
+    return True
+
+def _resume_hasher(upload):
+    """SHA-256 des upload.received premiers octets (recalculé depuis le disque si l'état est perdu)"""
+    with _hash_lock:
+        state = _hash_states.get(upload.id)
+    if state is not None and state[0] == upload.received:
+        return state[1]
+    hasher = hashlib.sha256()
+    remaining = upload.received
+    if remaining:
+        with open(upload.file_path, 'rb') as partial:
+            while remaining:
+                block = partial.read(min(COPY_BUFFER_SIZE, remaining))
+                if not block:
+                    raise ValueError('Fichier partiel plus court que l\'offset enregistré')
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+# ==================== SESSIONS ====================
+
+def create_upload_session(user, original_filename, total_size, mime_type=None):
+    """
+    Crée une session d'upload et son fichier partiel vide
+    Lève ValueError si le nom ou la taille sont refusés
+    """
+    if not isinstance(original_filename, str) or not allowed_file(original_filename):
+        raise ValueError('Format de fichier non autorisé')
+    if not isinstance(total_size, int) or isinstance(total_size, bool):
+        raise ValueError('Taille requise (nombre entier d\'octets)')
+    if total_size < 0 or total_size > current_app.config['UPLOAD_MAX_SIZE']:
+        raise ValueError(f'Taille invalide (maximum {current_app.config["UPLOAD_MAX_SIZE"]} octets)')
+    session_id = uuid.uuid4().hex
+    path = temp_path(session_id)
+    open(path, 'wb').close()
+    upload = UploadSession(
+        id=session_id,
+        user_id=user.id,
+        filename=unique_filename(original_filename),
+        original_filename=secure_filename(original_filename),
+        file_path=path,
+        mime_type=mime_type,
+        total_size=total_size,
+        received=0
+    )
+    db.session.add(upload)
+    return upload
+
+def append_chunk(upload, stream):
+    """
+    Écrit le corps de la requête à la suite des octets reçus (session verrouillée par lock_upload)
+    Les octets effectivement écrits sont comptés même si la connexion est coupée :
+    le client reprend à upload.received. Un reste d'écriture interrompue au-delà de
+    cet offset est tronqué avant d'écrire.
+    Retourne le nombre d'octets écrits
+    """
+    limit = min(current_app.config['UPLOAD_CHUNK_SIZE'], upload.total_size - upload.received)
+    hasher = _resume_hasher(upload)
+    written = 0
+    try:
+        with open(upload.file_path, 'r+b') as target:
+            target.truncate(upload.received)
+            target.seek(upload.received)
+            for block in iter_blocks(stream, limit):
+                target.write(block)
+                hasher.update(block)
+                written += len(block)
+    finally:
+        upload.received += written
+        _remember(upload.id, upload.received, hasher)
+    return written
+
+def complete_upload(upload, expected_sha256=None):
+    """
+    Transforme une session terminée en FileUpload, le fichier partiel devenant son blob
+    Lève ValueError si des octets manquent ou si l'empreinte ne correspond pas
+    """
+    if upload.received != upload.total_size:
+        raise ValueError(f'Upload incomplet : {upload.received}/{upload.total_size} octets reçus')
+    sha256 = _resume_hasher(upload).hexdigest()
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        raise ValueError('Empreinte SHA-256 différente du fichier reçu')
+    db.session.delete(upload)
+    file_upload = store_upload(
+        upload.file_path, sha256, upload.total_size,
+        original_filename=upload.original_filename,
+        mime_type=upload.mime_type,
+        user_id=upload.user_id
+    )
+    _forget(upload.id)
+    return file_upload
+
+def abort_upload(upload):
+    """Abandonne une session et supprime son fichier partiel"""
+    if os.path.exists(upload.file_path):
+        os.remove(upload.file_path)
+    db.session.delete(upload)
+    _forget(upload.id)
+
+def purge_upload_sessions(max_age):
+    """
+    Supprime les sessions sans activité depuis max_age secondes et leurs fichiers partiels
+    Retourne le nombre de sessions supprimées
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    uploads = db.session.scalars(select(UploadSession).where(UploadSession.updated_at < cutoff)).all()
+    for upload in uploads:
+        abort_upload(upload)
+    db.session.commit()
+    return len(uploads)
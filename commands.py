@@ -0,0 +1,167 @@
+"""
+Commandes CLI de maintenance de la base de données
+Mise à niveau du schéma, rattrapage des données, vérification des plans d'exécution
+archivage du journal d'activité et rapport des plans d'exécution par endpoint
+"""
+import json
+import click
+from flask import current_app
+from sqlalchemy import select
+from models import db, User, Role
+from schema import upgrade_schema, backfill_categories
+from query_plans import check_hot_queries
+from counters import reconcile_counters
+from rollups import rebuild_rollups
+from chunked_upload import purge_upload_sessions
+from storage import migrate_uploads, reconcile_blob_refs
+from query_report import plan_issues, query_report, seed_report_data
+from retention import archive_activity, ensure_partitions, partition_activity_log
+
+def init_commands(app):
+    """Enregistre les commandes de maintenance sur l'application"""
+    
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Met à niveau le schéma d'une base existante (tables et index manquants)"""
+        operations = upgrade_schema(echo=click.echo)
+        if not operations:
+            click.echo('✓ Schéma déjà à jour')
+    
+    @app.cli.command('backfill-categories')
+    def backfill_categories_command():
+        """Rattache les produits à la table Category et recalcule les compteurs"""
+        count = backfill_categories()
+        click.echo(f'✓ {count} catégorie(s) recalculée(s)')
+    
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recalcule les compteurs des tableaux de bord et corrige la dérive"""
+        drift = reconcile_counters()
+        for user_id, name, old, new in drift:
+            scope = 'global' if user_id == 0 else f'utilisateur {user_id}'
+            click.echo(f'✗ {name} ({scope}) : {old} -> {new}')
+        click.echo(f'✓ {len(drift)} compteur(s) corrigé(s)')
+    
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recalcule les agrégats horaires et journaliers depuis le journal d'activité"""
+        click.echo(f'✓ {rebuild_rollups()} agrégat(s) recalculé(s)')
+    
+    @app.cli.command('purge-uploads')
+    def purge_uploads():
+        """Supprime les uploads par morceaux abandonnés (UPLOAD_SESSION_TTL) et leurs fichiers partiels"""
+        count = purge_upload_sessions(current_app.config['UPLOAD_SESSION_TTL'])
+        click.echo(f'✓ {count} session(s) d\'upload supprimée(s)')
+    
+    @app.cli.command('migrate-uploads')
+    @click.option('--chunk', default=500, help='Nombre de fichiers traités par transaction')
+    def migrate_uploads_command(chunk):
+        """Range les fichiers uploadés à plat dans le stockage par contenu (ab/cd/<sha256>)"""
+        stats = migrate_uploads(chunk)
+        click.echo(f'✓ {stats["migrated"]} fichier(s) migré(s), {stats["duplicates"]} doublon(s) supprimé(s)')
+        if stats['missing']:
+            click.echo(f'⚠ {stats["missing"]} fichier(s) introuvable(s), laissé(s) en place')
+    
+    @app.cli.command('reconcile-blobs')
+    def reconcile_blobs():
+        """Recalcule les compteurs de références des fichiers partagés (correction de dérive)"""
+        click.echo(f'✓ {reconcile_blob_refs()} compteur(s) corrigé(s)')
+    
+    @app.cli.command('partition-activity')
+    def partition_activity():
+        """Partitionne activity_log par mois (MySQL) pour supprimer les mois expirés en O(1)"""
+        operations = partition_activity_log(current_app.config['ACTIVITY_PARTITIONS_AHEAD'])
+        for operation in operations:
+            click.echo(f'✓ {operation}')
+        if not operations:
+            click.echo('✓ Rien à faire (table déjà partitionnée ou base non MySQL)')
+    
+    @app.cli.command('archive-activity')
+    @click.option('--days', type=int, default=None, help='Rétention en jours (ACTIVITY_RETENTION_DAYS par défaut)')
+    @click.option('--dry-run', is_flag=True, help='Affiche les mois expirés sans rien modifier')
+    def archive_activity_command(days, dry_run):
+        """Archive les activités expirées (JSONL compressé) puis les supprime"""
+        config = current_app.config
+        if not dry_run:
+            for name in ensure_partitions(config['ACTIVITY_PARTITIONS_AHEAD']):
+                click.echo(f'✓ Partition créée: {name}')
+        results = archive_activity(
+            days if days is not None else config['ACTIVITY_RETENTION_DAYS'],
+            config['ACTIVITY_ARCHIVE_DIR'], config['ACTIVITY_ARCHIVE_CHUNK'], dry_run
+        )
+        for month, path, archived, deleted in results:
+            if dry_run:
+                click.echo(f'• {month:%Y-%m} : {archived} activité(s) à archiver')
+            else:
+                click.echo(f'✓ {month:%Y-%m} : {archived} archivée(s) dans {path or "-"}, {deleted} supprimée(s)')
+        if not results:
+            click.echo('✓ Aucune activité expirée')
+    
+    @app.cli.command('check-indexes')
+    def check_indexes():
+        """Vérifie avec EXPLAIN que les requêtes fréquentes utilisent un index"""
+        problems = 0
+        for name, plan in check_hot_queries():
+            issues = []
+            if plan['full_scans']:
+                issues.append(f'parcours complet: {", ".join(plan["full_scans"])}')
+            if plan['filesort']:
+                issues.append('tri sans index')
+            
+            indexes = ', '.join(plan['indexes']) or 'aucun'
+            if issues:
+                problems += 1
+                click.echo(f'✗ {name} — {"; ".join(issues)} (index: {indexes})')
+            else:
+                click.echo(f'✓ {name} — index: {indexes}')
+        
+        if problems:
+            click.echo(f'\n{problems} requête(s) sans plan indexé. Exécutez "flask upgrade-db".')
+            raise SystemExit(1)
+        click.echo('\n✓ Toutes les requêtes fréquentes utilisent un index')
+    
+    @app.cli.command('query-report')
+    @click.option('--user', 'username', default=None, help='Administrateur utilisé (premier admin par défaut)')
+    @click.option('--seed', type=int, default=0, help='Ajoute N produits et N activités de test avant l\'analyse')
+    @click.option('--json', 'as_json', is_flag=True, help='Rapport complet au format JSON')
+    @click.option('--strict', is_flag=True, help='Code de sortie 1 si un plan pose problème')
+    def query_report_command(username, seed, as_json, strict):
+        """Appelle chaque route GET et analyse avec EXPLAIN les requêtes SQL émises"""
+        query = select(User).join(User.roles).where(Role.name == 'admin').order_by(User.id)
+        if username:
+            query = select(User).where(User.username == username)
+        user = db.session.scalars(query.limit(1)).first()
+        if user is None:
+            click.echo('✗ Aucun administrateur trouvé. Exécutez d\'abord "flask create-admin"')
+            raise SystemExit(1)
+        if seed:
+            seed_report_data(user, seed)
+            click.echo(f'✓ {seed} produit(s) et activité(s) de test créés')
+        
+        report = query_report(current_app, user)
+        problems = sum(1 for entry in report for plan in entry.get('plans', ()) if plan_issues(plan['plan']))
+        if as_json:
+            click.echo(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+        else:
+            for entry in report:
+                if entry['skipped']:
+                    click.echo(f'- {entry["endpoint"]} ignoré ({entry["skipped"]})')
+                    continue
+                click.echo(f'\n{entry["endpoint"]} GET {entry["url"]} -> {entry["status"]}, '
+                           f'{entry["queries"]} requête(s)')
+                if entry['error']:
+                    click.echo(f'  ✗ erreur: {entry["error"]}')
+                for plan in entry['plans']:
+                    issues = plan_issues(plan['plan'])
+                    summary = plan['plan']
+                    details = [f'index: {", ".join(summary.get("indexes") or []) or "aucun"}']
+                    if summary.get('rows') is not None:
+                        details.append(f'lignes estimées: {summary["rows"]}')
+                    if plan['count'] > 1:
+                        details.append(f'{plan["count"]}x')
+                    mark = '✗' if issues else '✓'
+                    click.echo(f'  {mark} {plan["sql"][:100]}')
+                    click.echo(f'      {"; ".join(issues + details)}')
+            click.echo(f'\n{problems} requête(s) avec un plan à revoir')
+        if strict and problems:
+            raise SystemExit(1)
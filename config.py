@@ -33,6 +33,54 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
     
+    # Upload par morceaux avec reprise (API /api/uploads/sessions)
+    UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # 1 GB max par fichier
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Taille maximale d'un morceau (inférieure à MAX_CONTENT_LENGTH)
+    UPLOAD_SESSION_TTL = 24 * 3600  # Sessions sans activité supprimées par "flask purge-uploads" (secondes)
+    
+    # Configuration de la pagination de l'API
+    API_PAGE_SIZE = 50  # Taille de page par défaut
+    API_MAX_PAGE_SIZE = 500  # Taille de page maximale acceptée
+    API_BULK_MAX_ITEMS = 10000  # Nombre maximal d'opérations par requête en lot
+    PRODUCTS_PAGE_SIZE = 24  # Produits par page sur /products (défilement infini)
+    
+    # Configuration de la recherche plein texte
+    SEARCH_MAX_RESULTS = 200  # Nombre maximal de résultats classés par pertinence
+    SUGGEST_VERSION_CHECK = 5  # Intervalle de vérification des écritures des autres workers (secondes)
+    
+    # Bornes des tranches de prix des facettes (en euros)
+    FACET_PRICE_BUCKETS = (50, 100, 500, 1000)
+    
+    # Configuration du cache des listes de produits
+    PRODUCT_CACHE_SIZE = 256  # Nombre maximal de listes en cache
+    PRODUCT_CACHE_TTL = 60  # Durée de vie d'une entrée (secondes)
+    FRAGMENT_CACHE_SIZE = 2048  # Nombre maximal de fragments de templates en cache
+    FRAGMENT_CACHE_TTL = 300  # Durée de vie d'un fragment (secondes)
+    
+    # Cache de l'utilisateur connecté (0 pour désactiver)
+    PRINCIPAL_CACHE_SIZE = 1024  # Nombre maximal d'utilisateurs en cache
+    PRINCIPAL_CACHE_TTL = 30  # Délai maximal de prise en compte d'un changement fait par un autre worker (secondes)
+    
+    # Instrumentation des requêtes SQL (comptage par requête HTTP, détection des N+1)
+    QUERY_STATS_ENABLED = False
+    QUERY_STATS_HEADERS = False  # En-têtes X-Query-Count / X-Query-Time
+    QUERY_N_PLUS_ONE_THRESHOLD = 5  # Requêtes identiques au-delà desquelles un N+1 est signalé
+    
+    # Flux temps réel (Server-Sent Events)
+    SSE_KEEPALIVE = 15  # Intervalle des messages de maintien de connexion (secondes)
+    SSE_QUEUE_SIZE = 100  # Événements en attente par connexion avant déconnexion
+    
+    # Journal d'activité (écriture par lots en arrière-plan)
+    ACTIVITY_LOG_ASYNC = True  # False : écrit dans la transaction de la requête
+    ACTIVITY_QUEUE_SIZE = 10000  # Entrées en attente avant contre-pression
+    ACTIVITY_BATCH_SIZE = 500  # Entrées maximales par INSERT
+    ACTIVITY_FLUSH_INTERVAL = 1.0  # Délai maximal avant écriture d'un lot (secondes)
+    ACTIVITY_ENQUEUE_TIMEOUT = 0.5  # Attente maximale sur file pleine avant écriture directe (secondes)
+    ACTIVITY_RETENTION_DAYS = 365  # Ancienneté au-delà de laquelle les activités sont archivées (arrondie au mois)
+    ACTIVITY_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archives')
+    ACTIVITY_ARCHIVE_CHUNK = 5000  # Lignes lues ou supprimées par aller-retour
+    ACTIVITY_PARTITIONS_AHEAD = 3  # Partitions MySQL mensuelles créées à l'avance
+    
     # Configuration Flask-Admin
     FLASK_ADMIN_SWATCH = 'cerulean'
     
@@ -48,6 +96,8 @@ class DevelopmentConfig(Config):
     """Configuration pour l'environnement de développement"""
     DEBUG = True
     TESTING = False
+    QUERY_STATS_ENABLED = True
+    QUERY_STATS_HEADERS = True
 
 class ProductionConfig(Config):
     """Configuration pour l'environnement de production"""
@@ -60,6 +110,8 @@ class TestingConfig(Config):
     """Configuration pour les tests"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
+    QUERY_STATS_ENABLED = True  # Les budgets de requêtes font échouer les tests
+    ACTIVITY_LOG_ASYNC = False  # Journal visible dès le commit de la requête
 
 # Dictionnaire des configurations
 config = {
@@ -0,0 +1,169 @@
+"""
+Compteurs précalculés des tableaux de bord
+Chaque insertion ou suppression ajuste les compteurs dans la même transaction
+(incrément SQL), les tableaux de bord les lisent en une requête par clé primaire ;
+flask reconcile-counters corrige une éventuelle dérive
+"""
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+from models import db, StatCounter, User, Role, Product, FileUpload, ActivityLog, increment_row
+from broadcast import publish_after_commit
+
+# Identifiant utilisateur des compteurs globaux
+GLOBAL = 0
+
+# Modèles comptés : nom du compteur et attribut propriétaire (compteur par utilisateur)
+COUNTED_MODELS = {
+    User: ('users', None),
+    Role: ('roles', None),
+    Product: ('products', 'user_id'),
+    FileUpload: ('uploads', 'user_id'),
+    ActivityLog: ('activities', 'user_id'),
+}
+
+COUNTER_NAMES = ('users', 'active_users', 'inactive_users', 'roles', 'products', 'uploads', 'activities')
+
+def _activity_counter(active):
+    """Compteur d'un utilisateur selon son statut (None n'est compté nulle part)"""
+    if active is True:
+        return 'active_users'
+    if active is False:
+        return 'inactive_users'
+    return None
+
+def _add(deltas, name, user_id, delta):
+    if name is not None and user_id is not None:
+        key = (user_id, name)
+        deltas[key] = deltas.get(key, 0) + delta
+
+def count_change(deltas, model, delta, user_id=None):
+    """Ajoute à deltas l'effet de delta lignes de model (et de leur propriétaire)"""
+    name, owner = COUNTED_MODELS[model]
+    _add(deltas, name, GLOBAL, delta)
+    if owner is not None:
+        _add(deltas, name, user_id, delta)
+
+def adjust_counters(session, deltas):
+    """
+    Applique {(user_id, name): delta} dans la transaction courante
+    À appeler explicitement après des écritures ensemblistes (insert/delete Core)
+    qui ne passent pas par le flush de la session
+    """
+    table = StatCounter.__table__
+    connection = session.connection()
+    
+    # Variations diffusées en temps réel après le commit (flux SSE), par portée
+    scopes = {}
+    for (user_id, name), delta in deltas.items():
+        if delta:
+            scopes.setdefault(user_id, {})[name] = delta
+    for user_id, scope_deltas in scopes.items():
+        publish_after_commit(session, 'counters', {'user_id': user_id, 'deltas': scope_deltas})
+    
+    # Upsert atomique, dans un ordre fixe : pas d'interblocage entre transactions concurrentes
+    for (user_id, name), delta in sorted(deltas.items()):
+        if delta:
+            increment_row(connection, table, {'user_id': user_id, 'name': name}, {'value': delta})
+
+def get_counters(user_id=GLOBAL):
+    """Compteurs globaux (ou d'un utilisateur) en une lecture par clé primaire"""
+    counters = dict.fromkeys(COUNTER_NAMES, 0)
+    counters.update(db.session.execute(
+        select(StatCounter.name, StatCounter.value).where(StatCounter.user_id == user_id)
+    ).all())
+    return counters
+
+@event.listens_for(Session, 'after_flush')
+def _count_changes(session, flush_context):
+    """Ajuste les compteurs selon les lignes insérées, supprimées ou réattribuées"""
+    deltas = {}
+    deleted_users = []
+    for obj in session.new:
+        if type(obj) in COUNTED_MODELS:
+            owner = COUNTED_MODELS[type(obj)][1]
+            count_change(deltas, type(obj), 1, getattr(obj, owner) if owner else None)
+            if isinstance(obj, User):
+                _add(deltas, _activity_counter(obj.active), GLOBAL, 1)
+    for obj in session.deleted:
+        if type(obj) in COUNTED_MODELS:
+            state = inspect(obj)
+            owner = COUNTED_MODELS[type(obj)][1]
+            user_id = None
+            if owner:
+                history = state.attrs[owner].history
+                user_id = (history.deleted or history.unchanged or [getattr(obj, owner)])[0]
+            count_change(deltas, type(obj), -1, user_id)
+            if isinstance(obj, User):
+                history = state.attrs.active.history
+                active = (history.deleted or history.unchanged or [obj.active])[0]
+                _add(deltas, _activity_counter(active), GLOBAL, -1)
+                deleted_users.append(obj.id)
+    for obj in session.dirty:
+        if type(obj) not in COUNTED_MODELS or not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        name, owner = COUNTED_MODELS[type(obj)]
+        if owner:
+            # Changement de propriétaire : le compteur suit la ligne
+            history = state.attrs[owner].history
+            if history.has_changes():
+                for old in history.deleted:
+                    _add(deltas, name, old, -1)
+                for new in history.added:
+                    _add(deltas, name, new, 1)
+        if isinstance(obj, User):
+            history = state.attrs.active.history
+            if history.has_changes():
+                for old in history.deleted:
+                    _add(deltas, _activity_counter(old), GLOBAL, -1)
+                for new in history.added:
+                    _add(deltas, _activity_counter(new), GLOBAL, 1)
+    
+    if deltas:
+        adjust_counters(session, deltas)
+    if deleted_users:
+        session.connection().execute(
+            delete(StatCounter.__table__).where(StatCounter.__table__.c.user_id.in_(deleted_users))
+        )
+
+# ==================== RÉCONCILIATION ====================
+
+def compute_counters():
+    """Recalcule tous les compteurs depuis les tables (GROUP BY) : {(user_id, name): valeur}"""
+    counters = {}
+    for model, (name, owner) in COUNTED_MODELS.items():
+        counters[(GLOBAL, name)] = db.session.scalar(select(func.count()).select_from(model))
+        if owner:
+            column = getattr(model, owner)
+            rows = db.session.execute(
+                select(column, func.count()).where(column.isnot(None)).group_by(column)
+            )
+            counters.update(((user_id, name), count) for user_id, count in rows)
+    for active, count in db.session.execute(select(User.active, func.count()).group_by(User.active)):
+        name = _activity_counter(active)
+        if name:
+            counters[(GLOBAL, name)] = count
+    return counters
+
+def reconcile_counters():
+    """
+    Remplace les compteurs par les valeurs recalculées, dans une transaction
+    Retourne la liste des compteurs corrigés [(user_id, name, ancienne valeur, nouvelle)]
+    """
+    expected = compute_counters()
+    current = {(user_id, name): value for user_id, name, value in db.session.execute(
+        select(StatCounter.user_id, StatCounter.name, StatCounter.value)
+    )}
+    drift = [
+        (user_id, name, current.get((user_id, name), 0), expected.get((user_id, name), 0))
+        for user_id, name in sorted(set(expected) | set(current))
+        if current.get((user_id, name), 0) != expected.get((user_id, name), 0)
+    ]
+    table = StatCounter.__table__
+    db.session.execute(delete(table))
+    rows = [{'user_id': user_id, 'name': name, 'value': value}
+            for (user_id, name), value in expected.items() if value]
+    if rows:
+        db.session.execute(insert(table), rows)
+    db.session.commit()
+    return drift
@@ -0,0 +1,90 @@
+"""
+Facettes de recherche des produits
+Compte, en une seule requête, les produits par catégorie et par tranche de prix
+pour le contexte de recherche et de filtres courant
+"""
+from flask import current_app
+from sqlalchemy import case, func, select
+from models import db, Category, Product, get_catalog_version
+from cache import product_cache, product_cache_key
+from search import normalize, search_products
+
+def price_buckets(bounds):
+    """Tranches de prix [(min, max)] à partir des bornes configurées"""
+    edges = [None] + sorted(bounds) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _bucket_label(low, high):
+    """Libellé lisible d'une tranche de prix"""
+    if low is None:
+        return f'< {high:g} €'
+    if high is None:
+        return f'≥ {low:g} €'
+    return f'{low:g} – {high:g} €'
+
+def compute_facets(search=None, category=None, min_price=None, max_price=None):
+    """
+    Calcule les facettes catégorie et tranche de prix
+    La facette catégorie ignore le filtre de catégorie (pour proposer les autres choix),
+    la facette prix le respecte ; les deux sont issues du même GROUP BY
+    """
+    bounds = sorted(current_app.config['FACET_PRICE_BUCKETS'])
+    buckets = price_buckets(bounds)
+    bucket = case(
+        *[(Product.price < high, position) for position, (_, high) in enumerate(buckets[:-1])],
+        else_=len(buckets) - 1
+    ).label('bucket')
+
+    query = select(Product.category, bucket, func.count(Product.id)).group_by(
+        Product.category, bucket
+    )
+    if search:
+        ranked = search_products(search, current_app.config['SEARCH_MAX_RESULTS'])
+        query = query.where(Product.id.in_([product_id for product_id, _ in ranked]))
+    if min_price is not None:
+        query = query.where(Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.price <= max_price)
+
+    by_category = {}
+    by_bucket = [0] * len(buckets)
+    total = 0
+    for row_category, row_bucket, count in db.session.execute(query):
+        if row_category:
+            by_category[row_category] = by_category.get(row_category, 0) + count
+        if not category or row_category == category:
+            by_bucket[row_bucket] += count
+            total += count
+
+    return {
+        'total': total,
+        'categories': [
+            {'value': value, 'count': count}
+            for value, count in sorted(by_category.items(), key=lambda item: normalize(item[0]))
+        ],
+        'price_buckets': [
+            {'min': low, 'max': high, 'label': _bucket_label(low, high), 'count': by_bucket[position]}
+            for position, (low, high) in enumerate(buckets)
+        ]
+    }
+
+def category_facet():
+    """
+    Catégories non vides et leur nombre de produits, lus dans la table Category
+    (une ligne par catégorie, sans parcourir les produits)
+    """
+    rows = db.session.execute(
+        select(Category.name, Category.product_count).where(Category.product_count > 0)
+    )
+    return [
+        {'value': name, 'count': count}
+        for name, count in sorted(rows, key=lambda row: normalize(row[0]))
+    ]
+
+def get_facets(search=None, category=None, min_price=None, max_price=None):
+    """Facettes mises en cache par jeu de filtres et version du catalogue"""
+    version, _ = get_catalog_version()
+    key = product_cache_key('facets', search, category, min_price, max_price, version=version)
+    return product_cache.get_or_set(
+        key, lambda: compute_facets(search, category, min_price, max_price)
+    )
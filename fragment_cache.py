@@ -0,0 +1,59 @@
+"""
+Cache de fragments de templates Jinja
+Balise {% cache clé, ttl %}...{% endcache %} : le HTML rendu d'un bloc est
+mémorisé (cache LRU borné) et réutilisé tant que la clé ne change pas
+"""
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from cache import TTLCache
+
+# Fragments HTML rendus, indexés par (template, clé)
+fragment_cache = TTLCache(maxsize=2048, ttl=300)
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache clé %} ou {% cache clé, ttl %}
+    La clé doit identifier tout ce dont dépend le fragment : version de l'entité
+    (compteur propre à l'entité, ou version du catalogue pour un agrégat) et droits du visiteur (voir permission_bucket)
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, template_name, key, ttl, caller):
+        """Retourne le fragment en cache, ou le rend et le mémorise"""
+        return fragment_cache.get_or_set((template_name, key), lambda: Markup(caller()), ttl)
+
+def permission_bucket(owner_id=None):
+    """
+    Catégorie de droits du visiteur sur une entité : 'admin', 'owner', 'other'
+    (ou 'anonymous' hors connexion)
+    Deux visiteurs de la même catégorie voient exactement le même fragment
+    """
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    if current_user.has_role('admin'):
+        return 'admin'
+    if owner_id is not None and current_user.id == owner_id:
+        return 'owner'
+    return 'other'
+
+def init_fragment_cache(app):
+    """Active la balise {% cache %} et configure le cache depuis la configuration"""
+    fragment_cache.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', 2048)
+    fragment_cache.ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['permission_bucket'] = permission_bucket
+    return fragment_cache
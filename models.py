@@ -3,12 +3,60 @@ Modèles de données de l'application
 Définit les tables de la base de données avec SQLAlchemy
 """
 from datetime import datetime
+from blinker import Namespace
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, func, insert, inspect, select, update, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+def serialize_fields(obj, fields):
+    """
+    Sérialise uniquement les attributs demandés d'un objet
+    Les dates sont converties en ISO 8601 ; les colonnes non demandées ne sont
+    jamais lues, ce qui évite de recharger des colonnes différées (load_only)
+    """
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+# Instructions d'upsert par dialecte (INSERT ... ON CONFLICT DO UPDATE)
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def increment_row(connection, table, keys, increments, values=None):
+    """
+    Ajoute increments {colonne: delta} à la ligne de clé primaire keys, insérée si absente,
+    en une seule instruction atomique : INSERT ... ON DUPLICATE KEY UPDATE (MySQL) ou
+    ON CONFLICT DO UPDATE (SQLite, PostgreSQL). Deux premières écritures concurrentes
+    sur la même clé ne peuvent pas échouer sur la clé dupliquée
+    values : autres colonnes, écrites à l'insertion comme à la mise à jour
+    """
+    values = values or {}
+    changes = {name: table.c[name] + delta for name, delta in increments.items()}
+    changes.update(values)
+    row = {**keys, **increments, **values}
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table).values(row).on_duplicate_key_update(changes)
+    elif dialect in _UPSERT_INSERTS:
+        statement = _UPSERT_INSERTS[dialect](table).values(row).on_conflict_do_update(
+            index_elements=list(keys), set_=changes
+        )
+    else:
+        # Autres bases : mise à jour, puis insertion si la ligne n'existe pas
+        conditions = [table.c[name] == value for name, value in keys.items()]
+        if connection.execute(update(table).where(*conditions).values(changes)).rowcount:
+            return
+        statement = insert(table).values(row)
+    connection.execute(statement)
+
 # Table d'association pour la relation many-to-many entre User et Role
 user_roles = db.Table('user_roles',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
@@ -51,70 +99,179 @@ class User(UserMixin, db.Model):
     
     def has_role(self, role_name):
         """Vérifie si l'utilisateur a un rôle spécifique"""
-        return any(role.name == role_name for role in self.roles)
+        return role_name in self.role_names
+    
+    @property
+    def role_names(self):
+        """Noms des rôles (frozenset calculé une fois par instance, recherche en O(1))"""
+        names = self.__dict__.get('_role_names')
+        if names is None:
+            names = self.__dict__['_role_names'] = frozenset(role.name for role in self.roles)
+        return names
+    
+    # Champs exposés par l'API REST (ordre de sérialisation)
+    API_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'active', 'created_at', 'roles')
+    
+    def to_dict(self, fields=None):
+        """Convertit l'objet en dictionnaire pour l'API REST (limité à fields si fourni)"""
+        fields = fields or self.API_FIELDS
+        data = serialize_fields(self, [field for field in fields if field != 'roles'])
+        if 'roles' in fields:
+            data['roles'] = [role.name for role in self.roles]
+        return data
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+@event.listens_for(User.roles, 'append')
+@event.listens_for(User.roles, 'remove')
+def _reset_role_names(user, *args):
+    """Les noms de rôles mémorisés sont recalculés après un changement de rôles"""
+    user.__dict__.pop('_role_names', None)
+
+@event.listens_for(User, 'expire')
+def _reset_role_names_on_expire(user, attrs):
+    """Les rôles rechargés depuis la base invalident les noms mémorisés"""
+    if attrs is None or 'roles' in attrs:
+        user.__dict__.pop('_role_names', None)
+
+class Category(db.Model):
+    """Catégorie de produits avec son nombre de produits tenu à jour à chaque écriture"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
 class Product(db.Model):
     """Modèle pour les produits (exemple de données à gérer)"""
+    __table_args__ = (
+        # Listes triées par date (pagination par curseur, page /products)
+        db.Index('ix_product_created_at_id', 'created_at', 'id'),
+        # Filtre par catégorie suivi du tri par date
+        db.Index('ix_product_category_created_at', 'category', 'created_at', 'id'),
+        # Filtres par fourchette de prix
+        db.Index('ix_product_price', 'price'),
+        # Produits récents d'un utilisateur (dashboard)
+        db.Index('ix_product_user_created_at', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False, default=0.0)
     stock = db.Column(db.Integer, default=0)
-    category = db.Column(db.String(50))
+    category = db.Column(db.String(50))  # Nom de la catégorie (copie dénormalisée)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
     image_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Compteur de modifications incrémenté en SQL à chaque UPDATE (clé du cache des cartes)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version') + 1)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
-    def to_dict(self):
-        """Convertit l'objet en dictionnaire pour l'API REST"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'price': self.price,
-            'stock': self.stock,
-            'category': self.category,
-            'image_url': self.image_url,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'user_id': self.user_id
-        }
+    # Catégorie normalisée, renseignée automatiquement à partir de category
+    category_ref = db.relationship('Category')
+    
+    # Champs exposés par l'API REST (ordre de sérialisation)
+    API_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'category', 'image_url',
+                  'created_at', 'updated_at', 'user_id')
+    
+    def to_dict(self, fields=None):
+        """Convertit l'objet en dictionnaire pour l'API REST (limité à fields si fourni)"""
+        return serialize_fields(self, fields or self.API_FIELDS)
     
     def __repr__(self):
         return f'<Product {self.name}>'
 
 class FileUpload(db.Model):
     """Modèle pour les fichiers téléchargés"""
+    __table_args__ = (
+        # Fichiers récents d'un utilisateur (dashboard, page d'upload)
+        db.Index('ix_file_upload_user_uploaded_at', 'user_id', 'uploaded_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer)  # en bytes
     mime_type = db.Column(db.String(100))
+    sha256 = db.Column(db.String(64), index=True)  # empreinte du contenu (FileBlob partagé)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    # Champs exposés par l'API REST (le chemin complet n'est jamais exposé)
+    API_FIELDS = ('id', 'filename', 'original_filename', 'file_size', 'mime_type',
+                  'sha256', 'uploaded_at', 'user_id')
+    
+    def to_dict(self, fields=None):
+        """Convertit l'objet en dictionnaire pour l'API REST (limité à fields si fourni)"""
+        return serialize_fields(self, fields or self.API_FIELDS)
+    
+    def __repr__(self):
+        return f'<FileUpload {self.original_filename}>'
+
+class FileBlob(db.Model):
+    """
+    Contenu stocké une seule fois, sous UPLOAD_FOLDER/ab/cd/<sha256> (voir storage.py)
+    ref_count est le nombre de FileUpload qui le partagent ; le fichier est supprimé
+    quand la dernière référence disparaît
+    """
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger)  # en bytes
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileBlob {self.sha256} ({self.ref_count})>'
+
+class UploadSession(db.Model):
+    """
+    Upload par morceaux en cours (voir chunked_upload.py)
+    received est le nombre d'octets déjà écrits dans file_path : le client reprend à cet offset
+    """
+    __table_args__ = (
+        # Purge des sessions abandonnées
+        db.Index('ix_upload_session_updated_at', 'updated_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    mime_type = db.Column(db.String(100))
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
     def to_dict(self):
-        """Convertit l'objet en dictionnaire pour l'API REST"""
         return {
             'id': self.id,
-            'filename': self.filename,
-            'original_filename': self.original_filename,
-            'file_size': self.file_size,
+            'filename': self.original_filename,
+            'size': self.total_size,
+            'offset': self.received,
             'mime_type': self.mime_type,
-            'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None,
-            'user_id': self.user_id
+            'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
     def __repr__(self):
-        return f'<FileUpload {self.original_filename}>'
+        return f'<UploadSession {self.original_filename} {self.received}/{self.total_size}>'
 
 class ActivityLog(db.Model):
     """Modèle pour les logs d'activité (pour le dashboard)"""
+    __table_args__ = (
+        # Activités récentes d'un utilisateur et comptage par utilisateur
+        db.Index('ix_activity_log_user_created_at', 'user_id', 'created_at'),
+        # Activités récentes toutes confondues (dashboard admin)
+        db.Index('ix_activity_log_created_at', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     action = db.Column(db.String(100), nullable=False)
@@ -126,3 +283,224 @@ class ActivityLog(db.Model):
     
     def __repr__(self):
         return f'<ActivityLog {self.action}>'
+
+class CatalogVersion(db.Model):
+    """Version globale du catalogue, incrémentée à chaque écriture sur Product"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
+class StatCounter(db.Model):
+    """
+    Compteur précalculé des tableaux de bord, mis à jour à chaque insertion ou suppression
+    user_id vaut 0 pour les compteurs globaux (voir counters.py)
+    """
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.name}[{self.user_id}]={self.value}>'
+
+class ActivityRollup(db.Model):
+    """
+    Nombre d'activités par période (heure ou jour), action et utilisateur
+    Maintenu à chaque écriture du journal (voir rollups.py) ; conservé après
+    l'archivage des activités brutes. user_id vaut 0 pour les activités sans utilisateur
+    """
+    __table_args__ = (
+        # Séries toutes actions confondues
+        db.Index('ix_activity_rollup_granularity_bucket', 'granularity', 'bucket'),
+    )
+
+    # Ordre de la clé : séries d'une action sur une plage de périodes
+    granularity = db.Column(db.String(5), primary_key=True)
+    action = db.Column(db.String(100), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ActivityRollup {self.granularity} {self.bucket} {self.action}[{self.user_id}]={self.count}>'
+
+# ==================== SUIVI DES MODIFICATIONS DU CATALOGUE ====================
+
+# Signal émis après le commit d'une transaction ayant modifié des produits
+_signals = Namespace()
+catalog_changed = _signals.signal('catalog-changed')
+
+CATALOG_VERSION_ID = 1
+
+def get_catalog_version():
+    """Retourne (version, updated_at) du catalogue en une lecture par clé primaire"""
+    row = db.session.query(CatalogVersion.version, CatalogVersion.updated_at).filter(
+        CatalogVersion.id == CATALOG_VERSION_ID
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def bump_catalog_version(session, changes=None):
+    """
+    Incrémente la version du catalogue dans la transaction courante
+    À appeler explicitement après des écritures ensemblistes (insert/update/delete
+    Core) qui ne passent pas par le flush de la session
+    changes: liste des modifications (voir _product_change) ou None si inconnue ;
+    dans ce cas les abonnés reconstruisent leurs structures complètement
+    """
+    # Upsert atomique : la première écriture du catalogue crée la ligne sans conflit
+    increment_row(session.connection(), CatalogVersion.__table__, {'id': CATALOG_VERSION_ID},
+                  {'version': 1}, {'updated_at': datetime.utcnow()})
+    
+    pending = session.info.get('product_changes', [])
+    if changes is None or pending is None:
+        session.info['product_changes'] = None
+    else:
+        session.info['product_changes'] = pending + changes
+    session.info['catalog_changed'] = True
+    # Nombre d'incréments de la transaction : version attendue par les abonnés après le commit
+    session.info['catalog_bumps'] = session.info.get('catalog_bumps', 0) + 1
+
+def _product_change(op, product, old=None):
+    """
+    Décrit une modification de produit pour les abonnés du signal catalog_changed
+    (op, id, (ancien nom, ancienne catégorie), (nouveau nom, nouvelle catégorie))
+    """
+    new = None if op == 'delete' else (product.name, product.category)
+    return (op, product.id, old, new)
+
+def _previous_values(product):
+    """Nom et catégorie du produit avant les modifications en attente"""
+    state = inspect(product)
+    values = []
+    for attribute in ('name', 'category'):
+        history = state.attrs[attribute].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(product, attribute))
+    return tuple(values)
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_changes(session, flush_context):
+    """Détecte les produits créés, modifiés ou supprimés lors du flush"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changes.append(_product_change('insert', obj))
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj, include_collections=False):
+            changes.append(_product_change('update', obj, _previous_values(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes.append(_product_change('delete', obj, _previous_values(obj)))
+    if changes:
+        bump_catalog_version(session, changes)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_catalog_changes(session):
+    """Prévient les abonnés (caches, index) une fois les changements validés"""
+    if session.info.pop('catalog_changed', False):
+        catalog_changed.send(session, changes=session.info.pop('product_changes', None),
+                             bumps=session.info.pop('catalog_bumps', 0))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    """Oublie les changements annulés"""
+    session.info.pop('catalog_changed', None)
+    session.info.pop('product_changes', None)
+    session.info.pop('catalog_bumps', None)
+
+# ==================== COMPTEURS DES CATÉGORIES ====================
+
+@event.listens_for(Session, 'before_flush')
+def _maintain_categories(session, flush_context, instances):
+    """
+    Rattache les produits créés ou recatégorisés à leur Category (créée au besoin)
+    et ajuste product_count par incrément SQL (product_count = product_count + n),
+    sans relire ni recompter les produits
+    """
+    deltas, linked = {}, []
+    for obj in session.new:
+        if isinstance(obj, Product) and obj.category:
+            deltas[obj.category] = deltas.get(obj.category, 0) + 1
+            linked.append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            history = inspect(obj).attrs.category.history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            if old:
+                deltas[old] = deltas.get(old, 0) - 1
+            if obj.category:
+                deltas[obj.category] = deltas.get(obj.category, 0) + 1
+            linked.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            old = _previous_values(obj)[1]
+            if old:
+                deltas[old] = deltas.get(old, 0) - 1
+    if not linked and not any(deltas.values()):
+        return
+    
+    with session.no_autoflush:
+        categories = {category.name: category for category in session.query(Category).filter(
+            Category.name.in_(list(deltas))
+        )}
+    for name, delta in deltas.items():
+        category = categories.get(name)
+        if category is None:
+            category = categories[name] = Category(name=name, product_count=max(delta, 0))
+            session.add(category)
+        elif delta:
+            category.product_count = Category.product_count + delta
+    for product in linked:
+        product.category_ref = categories[product.category] if product.category else None
+
+def refresh_categories(session, names=None):
+    """
+    Recalcule en SQL ensembliste le lien product.category_id et product_count
+    des catégories données (toutes si names vaut None)
+    À appeler après des écritures ensemblistes sur Product, qui ne passent pas
+    par le flush de la session ; sert aussi de rattrapage (flask backfill-categories)
+    Retourne le nombre de catégories recalculées
+    """
+    connection = session.connection()
+    product, category = Product.__table__, Category.__table__
+    everything = names is None
+    if everything:
+        names = connection.scalars(select(product.c.category).distinct()).all()
+    names = sorted({name for name in names if name})
+    
+    if names:
+        existing = set(connection.scalars(select(category.c.name).where(category.c.name.in_(names))))
+        missing = [name for name in names if name not in existing]
+        if missing:
+            now = datetime.utcnow()
+            connection.execute(insert(category), [
+                {'name': name, 'product_count': 0, 'created_at': now} for name in missing
+            ])
+    elif not everything:
+        return 0
+    
+    # Lien produit -> catégorie (updated_at et version conservés : ce n'est pas une modification du produit)
+    category_id = select(category.c.id).where(category.c.name == product.c.category).scalar_subquery()
+    link = update(product).values(category_id=category_id, updated_at=product.c.updated_at,
+                                  version=product.c.version)
+    count = select(func.count()).select_from(product).where(
+        product.c.category_id == category.c.id
+    ).scalar_subquery()
+    recount = update(category).values(product_count=count)
+    
+    if not everything:
+        # Produits de ces catégories, y compris ceux qui viennent d'en sortir
+        ids = select(category.c.id).where(category.c.name.in_(names))
+        link = link.where(or_(product.c.category.in_(names), product.c.category_id.in_(ids)))
+        recount = recount.where(category.c.name.in_(names))
+    
+    connection.execute(link)
+    return connection.execute(recount).rowcount
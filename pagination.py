@@ -0,0 +1,91 @@
+"""
+Pagination par curseur (keyset)
+Pagine les requêtes sur un couple de colonnes (horodatage, id) sans OFFSET
+"""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import Select
+from models import db
+
+def encode_cursor(created_at, item_id):
+    """Encode la position (created_at, id) en curseur opaque"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, item_id],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Décode un curseur opaque en tuple (created_at, id)
+    Lève ValueError si le curseur est invalide
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at)
+        # Les booléens JSON (sous-classe de int) ne sont pas des identifiants
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            raise ValueError
+        return created_at, item_id
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Curseur invalide')
+
+def keyset_filter(query, ts_column, id_column, cursor, descending=False):
+    """
+    Ajoute à la requête la condition "après le curseur" et l'ordre (ts, id)
+    Les horodatages NULL sont placés en tête en ordre croissant, comme MySQL et SQLite
+    """
+    if descending:
+        query = query.order_by(ts_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(ts_column.asc(), id_column.asc())
+
+    if cursor is None:
+        return query
+
+    created_at, item_id = decode_cursor(cursor)
+
+    if descending:
+        if created_at is None:
+            condition = and_(ts_column.is_(None), id_column < item_id)
+        else:
+            condition = or_(
+                ts_column < created_at,
+                and_(ts_column == created_at, id_column < item_id),
+                ts_column.is_(None)
+            )
+    else:
+        if created_at is None:
+            condition = or_(
+                and_(ts_column.is_(None), id_column > item_id),
+                ts_column.isnot(None)
+            )
+        else:
+            condition = or_(
+                ts_column > created_at,
+                and_(ts_column == created_at, id_column > item_id)
+            )
+
+    return query.filter(condition)
+
+def keyset_page(query, ts_column, id_column, limit, cursor=None, descending=False):
+    """
+    Récupère une page de résultats et le curseur de la page suivante
+    query peut être une requête ORM (objets) ou un select() Core (lignes)
+    Retourne (items, next_cursor) ; next_cursor vaut None sur la dernière page
+    """
+    query = keyset_filter(query, ts_column, id_column, cursor, descending).limit(limit + 1)
+    if isinstance(query, Select):
+        items = db.session.execute(query).all()
+    else:
+        items = query.all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, ts_column.key), getattr(last, id_column.key))
+
+    return items, next_cursor
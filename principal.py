@@ -0,0 +1,74 @@
+"""
+Chargement de l'utilisateur connecté (principal) à chaque requête
+L'utilisateur et ses rôles sont lus en une requête, puis gardés quelques secondes
+dans un cache mémoire par worker ; toute écriture sur un utilisateur ou un rôle
+invalide le cache après le commit
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+from models import db, User, Role
+from cache import TTLCache
+
+# Utilisateurs détachés de toute session, indexés par identifiant
+principal_cache = TTLCache(maxsize=1024, ttl=30)
+
+def load_principal(user_id):
+    """
+    Retourne l'utilisateur (avec ses rôles) rattaché à la session courante, ou None
+    Une entrée en cache est copiée dans la session sans requête (merge load=False)
+    """
+    if principal_cache.maxsize <= 0:
+        return db.session.get(User, user_id, options=[joinedload(User.roles)])
+    
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = db.session.get(User, user_id, options=[joinedload(User.roles)])
+        if user is None:
+            return None
+        # L'exemplaire en cache n'appartient à aucune session (partagé entre requêtes)
+        db.session.expunge(user)
+        principal_cache.set(user_id, user)
+    return db.session.merge(user, load=False)
+
+def invalidate_principal(user_id=None):
+    """Retire un utilisateur du cache (tous si user_id vaut None)"""
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.delete(user_id)
+
+@event.listens_for(Session, 'after_flush')
+def _track_principal_changes(session, flush_context):
+    """Repère les utilisateurs et rôles modifiés (profil, mot de passe, rôles, compte actif)"""
+    changed = session.info.get('principal_changes', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, Role):
+            # Un rôle renommé ou supprimé concerne tous les utilisateurs
+            changed.add(None)
+    if changed:
+        session.info['principal_changes'] = changed
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_principals(session):
+    """Invalide les utilisateurs modifiés une fois les changements validés"""
+    changed = session.info.pop('principal_changes', None)
+    if not changed:
+        return
+    if None in changed:
+        invalidate_principal()
+    else:
+        for user_id in changed:
+            invalidate_principal(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_principal_changes(session):
+    """Oublie les modifications annulées"""
+    session.info.pop('principal_changes', None)
+
+def init_principal(app):
+    """Configure la taille et la durée de vie du cache depuis la configuration"""
+    principal_cache.maxsize = app.config.get('PRINCIPAL_CACHE_SIZE', 1024)
+    principal_cache.ttl = app.config.get('PRINCIPAL_CACHE_TTL', 30)
+    return principal_cache
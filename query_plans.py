@@ -0,0 +1,120 @@
+"""
+Analyse des plans d'exécution (EXPLAIN)
+Détecte les parcours complets de table, les tris sans index (filesort)
+et les index utilisés, pour MySQL et SQLite
+"""
+from datetime import datetime
+from sqlalchemy import select
+from models import db, Product, ActivityLog, StatCounter
+from pagination import encode_cursor, keyset_filter
+from summary import recent_items_query
+from rollups import activity_series_query
+
+def compile_statement(statement, dialect):
+    """Compile une requête SQLAlchemy en (sql, paramètres) pour le pilote"""
+    compiled = statement.compile(dialect=dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    return str(compiled), params
+
+def explain(connection, sql, params=None):
+    """
+    Exécute EXPLAIN sur une requête SQL brute
+    Retourne une liste de dictionnaires (une entrée par étape du plan)
+    """
+    dialect = connection.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    result = connection.exec_driver_sql(prefix + sql, params or ())
+    return [dict(row._mapping) for row in result]
+
+def analyze_plan(dialect, plan):
+    """
+    Résume un plan d'exécution
+    Retourne {'full_scans': [...], 'filesort': bool, 'indexes': [...], 'rows': estimation}
+    """
+    summary = {'full_scans': [], 'filesort': False, 'indexes': [], 'rows': None}
+
+    if dialect == 'sqlite':
+        # Sous-requêtes de la clause FROM (co-routines, matérialisations)
+        subqueries = {
+            step.get('detail', '').split()[-1] for step in plan
+            if step.get('detail', '').startswith(('CO-ROUTINE ', 'MATERIALIZE '))
+        }
+        for step in plan:
+            detail = step.get('detail', '')
+            words = detail.split()
+            if detail.startswith('SCAN ') and 'INDEX' not in detail:
+                # Les sous-requêtes matérialisées et CTE ne sont pas des tables
+                if len(words) > 1 and words[1] not in ('SUBQUERY', 'CONSTANT') and words[1] not in subqueries:
+                    summary['full_scans'].append(words[1])
+            if 'USE TEMP B-TREE FOR' in detail and 'ORDER BY' in detail:
+                summary['filesort'] = True
+            if 'USING' in words and 'INDEX' in words:
+                position = words.index('INDEX')
+                if position + 1 < len(words):
+                    summary['indexes'].append(words[position + 1])
+            elif 'USING INTEGER PRIMARY KEY' in detail:
+                summary['indexes'].append('PRIMARY')
+    else:
+        rows = 0
+        for step in plan:
+            table = step.get('table')
+            if step.get('type') == 'ALL' and table and not table.startswith('<'):
+                summary['full_scans'].append(table)
+            if 'Using filesort' in (step.get('Extra') or ''):
+                summary['filesort'] = True
+            if step.get('key'):
+                summary['indexes'].append(step['key'])
+            rows += int(step.get('rows') or 0)
+        summary['rows'] = rows
+
+    return summary
+
+def hot_queries():
+    """
+    Requêtes les plus fréquentes de l'application, reproduites à l'identique
+    Retourne une liste (nom, requête SQLAlchemy)
+    """
+    sample_date = datetime(2024, 1, 1)
+    return [
+        ('api.get_products (page)',
+         select(Product).order_by(Product.created_at, Product.id).limit(51)),
+        ('api.get_products (page suivante)',
+         keyset_filter(select(Product), Product.created_at, Product.id,
+                       encode_cursor(sample_date, 1)).limit(51)),
+        ('api.get_products (catégorie)',
+         select(Product).where(Product.category == 'Livres')
+         .order_by(Product.created_at, Product.id).limit(51)),
+        ('api.get_products (prix)',
+         select(Product).where(Product.price >= 10, Product.price <= 20)),
+        ('main.products (tri par date)',
+         select(Product).order_by(Product.created_at.desc(), Product.id.desc()).limit(25)),
+        ('main.products (page suivante)',
+         keyset_filter(select(Product), Product.created_at, Product.id,
+                       encode_cursor(sample_date, 1), descending=True).limit(25)),
+        ('main.dashboard (éléments récents, UNION ALL)',
+         recent_items_query(1)),
+        ('main.dashboard (compteurs)',
+         select(StatCounter.name, StatCounter.value).where(StatCounter.user_id == 1)),
+        ('main.dashboard (activités récentes)',
+         select(ActivityLog).order_by(ActivityLog.created_at.desc()).limit(10)),
+        ('api.get_activity_stats (action)',
+         activity_series_query('hour', sample_date, datetime(2024, 1, 2), 'login')),
+        ('api.get_activity_stats (toutes actions)',
+         activity_series_query('day', sample_date, datetime(2024, 2, 1))),
+    ]
+
+def check_hot_queries():
+    """
+    Exécute EXPLAIN sur chaque requête fréquente
+    Retourne une liste (nom, résumé du plan)
+    """
+    report = []
+    with db.engine.connect() as connection:
+        dialect = connection.dialect
+        for name, statement in hot_queries():
+            sql, params = compile_statement(statement, dialect)
+            report.append((name, analyze_plan(dialect.name, explain(connection, sql, params))))
+    return report
@@ -0,0 +1,189 @@
+"""
+Rapport des plans d'exécution par endpoint
+Appelle chaque route GET de l'application (client de test, session administrateur),
+capture les requêtes SQL émises et passe chaque SELECT distinct à EXPLAIN
+(voir query_plans) : parcours complets, tris sans index, index utilisés, lignes estimées
+"""
+import re
+from contextlib import contextmanager
+from sqlalchemy import event, select
+from models import db, Product, FileUpload, User, ActivityLog, Role, Category
+from query_plans import analyze_plan, explain
+from query_stats import fingerprint
+from cache import product_cache
+from fragment_cache import fragment_cache
+from principal import principal_cache
+
+# Routes non appelées : fichiers statiques, flux sans fin, effets de bord, paramètres libres
+SKIPPED_ENDPOINTS = {'static', 'admin.static', 'auth.logout', 'api.stream_activity'}
+SKIPPED_SUFFIXES = ('.ajax_lookup', '.export')
+
+# Paramètres d'URL remplacés par l'identifiant d'une ligne existante
+URL_ARGUMENTS = {'product_id': Product, 'file_id': FileUpload, 'user_id': User}
+
+# Vues Flask-Admin qui attendent ?id= (nom de la vue -> modèle)
+ADMIN_MODELS = {
+    'product': Product, 'user': User, 'fileupload': FileUpload,
+    'category': Category, 'role': Role, 'activitylog': ActivityLog,
+}
+ADMIN_DETAIL_VIEWS = ('.details_view', '.edit_view')
+
+# Variantes de paramètres des routes les plus sollicitées
+QUERY_VARIANTS = {
+    'main.products': ['', '?search=pro', '?category=Livres'],
+    'api.get_products': ['', '?category=Livres', '?min_price=10&max_price=100'],
+    'api.search_products_api': ['?q=pro'],
+    'api.suggest_products': ['?q=pr'],
+    'api.get_product_facets': ['', '?search=pro'],
+    'api.get_activity_stats': ['?interval=hour', '?interval=day&action=login'],
+}
+
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+# Requêtes sur le catalogue du moteur (introspection), hors périmètre
+_CATALOG_RE = re.compile(r'\b(sqlite_master|sqlite_schema|information_schema)\b', re.IGNORECASE)
+
+@contextmanager
+def capture_queries(engine):
+    """Enregistre (sql, paramètres) de chaque requête exécutée sur engine"""
+    captured = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+def _sample_ids():
+    """Identifiant d'une ligne existante par modèle (None si la table est vide)"""
+    models = set(URL_ARGUMENTS.values()) | set(ADMIN_MODELS.values())
+    return {model: db.session.scalar(select(model.id).order_by(model.id).limit(1)) for model in models}
+
+def report_urls(app):
+    """
+    URLs à appeler : [(endpoint, url)] ou (endpoint, None, raison) pour les routes ignorées
+    Les paramètres d'URL sont remplacés par des identifiants existants
+    """
+    ids = _sample_ids()
+    urls = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        endpoint = rule.endpoint
+        if 'GET' not in rule.methods or endpoint in SKIPPED_ENDPOINTS or endpoint.endswith(SKIPPED_SUFFIXES):
+            continue
+        values = {}
+        missing = None
+        for argument in rule.arguments:
+            model = URL_ARGUMENTS.get(argument)
+            if model is None or ids[model] is None:
+                missing = argument
+                break
+            values[argument] = ids[model]
+        if missing:
+            urls.append((endpoint, None, f'aucune valeur pour {missing}'))
+            continue
+        path = rule.build(values)[1]
+        view = endpoint.split('.')[0]
+        if endpoint.endswith(ADMIN_DETAIL_VIEWS) and view in ADMIN_MODELS:
+            if ids[ADMIN_MODELS[view]] is None:
+                urls.append((endpoint, None, 'table vide'))
+                continue
+            urls.append((endpoint, f'{path}?id={ids[ADMIN_MODELS[view]]}', None))
+            continue
+        for query_string in QUERY_VARIANTS.get(endpoint, ['']):
+            urls.append((endpoint, path + query_string, None))
+    return urls
+
+def query_report(app, user):
+    """
+    Appelle chaque route GET connecté en tant que user et analyse les SELECT émis
+    Retourne [{'endpoint', 'url', 'status', 'error', 'queries', 'plans': [{'sql', 'count', 'plan'}], 'skipped'}]
+    Les caches applicatifs sont vidés avant chaque appel pour que les requêtes soient exécutées
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+    # Les erreurs et alertes N+1 figurent dans le rapport, pas dans les logs
+    logger_disabled, app.logger.disabled = app.logger.disabled, True
+    try:
+        return [_report_entry(app, client, endpoint, url, skipped)
+                for endpoint, url, skipped in report_urls(app)]
+    finally:
+        app.logger.disabled = logger_disabled
+
+def _report_entry(app, client, endpoint, url, skipped):
+    """Appel d'une URL et plans de ses requêtes distinctes"""
+    if url is None:
+        return {'endpoint': endpoint, 'url': None, 'skipped': skipped}
+    for cache in (product_cache, fragment_cache, principal_cache):
+        cache.clear()
+    engine = db.engine
+    # Contexte d'application propre : chaque appel a sa propre session SQLAlchemy
+    error = None
+    with app.app_context(), capture_queries(engine) as captured:
+        try:
+            response = client.get(url)
+            status = response.status_code
+            response.close()
+        except Exception as e:
+            # En DEBUG l'exception remonte du client de test : la route est notée en erreur
+            # et le rapport continue avec les suivantes
+            status, error = 500, str(e)
+
+    # Une analyse par requête distincte (les répétitions signalent un N+1)
+    statements = {}
+    for statement, parameters in captured:
+        if _EXPLAINABLE_RE.match(statement) and not _CATALOG_RE.search(statement):
+            key = fingerprint(statement)
+            if key in statements:
+                statements[key]['count'] += 1
+            else:
+                statements[key] = {'count': 1, 'statement': statement, 'parameters': parameters}
+
+    plans = []
+    with engine.connect() as connection:
+        for key, entry in statements.items():
+            try:
+                plan = analyze_plan(engine.dialect.name,
+                                    explain(connection, entry['statement'], entry['parameters']))
+            except Exception as e:
+                plan = {'error': str(e)}
+            plans.append({'sql': key, 'count': entry['count'], 'plan': plan})
+    return {
+        'endpoint': endpoint, 'url': url, 'status': status, 'error': error,
+        'queries': len(captured), 'plans': plans, 'skipped': None
+    }
+
+def plan_issues(plan):
+    """Problèmes d'un plan résumé : parcours complets, tri sans index, aucun index utilisé"""
+    if 'error' in plan:
+        return [f'EXPLAIN impossible: {plan["error"]}']
+    issues = []
+    if plan['full_scans']:
+        issues.append(f'parcours complet: {", ".join(plan["full_scans"])}')
+    if plan['filesort']:
+        issues.append('tri sans index')
+    if plan['full_scans'] and not plan['indexes']:
+        issues.append('aucun index')
+    return issues
+
+def seed_report_data(user, count):
+    """
+    Ajoute count produits et count activités appartenant à user, pour que les plans
+    reflètent une table non triviale (compteurs et agrégats maintenus par le flush)
+    """
+    categories = ['Électronique', 'Livres', 'Mobilier', 'Sport', 'Maison']
+    db.session.add_all(Product(
+        name=f'Produit de test {index}', description=f'Description du produit de test {index}',
+        price=round(5 + index * 1.5, 2), stock=index % 50,
+        category=categories[index % len(categories)], user_id=user.id
+    ) for index in range(count))
+    db.session.add_all(ActivityLog(
+        user_id=user.id, action=('login', 'create_product', 'update_product')[index % 3],
+        description=f'Activité de test {index}'
+    ) for index in range(count))
+    db.session.commit()
@@ -0,0 +1,126 @@
+"""
+Instrumentation des requêtes SQL par requête HTTP
+Compte les requêtes émises, regroupe les requêtes identiques par empreinte
+pour détecter les N+1, et vérifie le budget de requêtes déclaré par les vues
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Listes IN développées par le pilote : (?, ?, ?) -> (?)
+_IN_LIST_RE = re.compile(r'\(\s*(\?|%s|%\(\w+\)s|:\w+)(\s*,\s*(\?|%s|%\(\w+\)s|:\w+))+\s*\)')
+_SPACES_RE = re.compile(r'\s+')
+
+class QueryBudgetExceeded(AssertionError):
+    """Une vue a émis plus de requêtes SQL que son budget (levée en mode TESTING)"""
+
+class QueryStats:
+    """Requêtes SQL émises pendant une requête HTTP"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """Requêtes identiques exécutées au moins threshold fois : [(empreinte, nombre)]"""
+        return [(statement, count) for statement, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+def fingerprint(statement):
+    """Forme normalisée d'une requête : espaces et listes IN réduits"""
+    statement = _SPACES_RE.sub(' ', statement).strip()
+    return _IN_LIST_RE.sub('(?)', statement)
+
+def current_stats():
+    """Statistiques de la requête HTTP en cours (None hors requête, si désactivé ou suspendu)"""
+    if not has_request_context() or g.get('query_stats_paused'):
+        return None
+    return g.get('query_stats')
+
+@contextmanager
+def uncounted():
+    """
+    Exclut du comptage les requêtes exécutées dans le bloc : détections faites une fois
+    par processus (catalogue de la base), qui ne relèvent pas du coût de la vue
+    """
+    if not has_request_context():
+        yield
+        return
+    paused = g.get('query_stats_paused', False)
+    g.query_stats_paused = True
+    try:
+        yield
+    finally:
+        g.query_stats_paused = paused
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is not None and conn.info.get('query_started'):
+        stats.record(statement, time.perf_counter() - conn.info['query_started'].pop())
+
+def query_budget(max_queries):
+    """
+    Déclare le nombre maximal de requêtes SQL d'une vue
+    Dépassement : exception QueryBudgetExceeded en mode TESTING (le test échoue),
+    avertissement dans les logs sinon
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = f(*args, **kwargs)
+            stats = current_stats()
+            if stats is not None and stats.count > max_queries:
+                top = ', '.join(f'{count}x {statement[:80]}'
+                                for statement, count in stats.fingerprints.most_common(3))
+                message = f'{f.__name__}: {stats.count} requêtes SQL pour un budget de {max_queries} ({top})'
+                if current_app.testing:
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
+
+def init_query_stats(app):
+    """
+    Active le comptage par requête (QUERY_STATS_ENABLED) ; en développement, les
+    en-têtes X-Query-Count / X-Query-Time et l'alerte N+1 sont ajoutés aux réponses
+    """
+    if not app.config.get('QUERY_STATS_ENABLED'):
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        repeated = stats.repeated(app.config['QUERY_N_PLUS_ONE_THRESHOLD'])
+        for statement, count in repeated:
+            app.logger.warning(f'N+1 probable ({count}x) sur {request.endpoint}: {statement[:200]}')
+        if app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time'] = f'{stats.duration * 1000:.1f}ms'
+            if repeated:
+                response.headers['X-Query-Repeated'] = str(sum(count for _, count in repeated))
+        return response
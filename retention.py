@@ -0,0 +1,207 @@
+"""
+Rétention et archivage du journal d'activité
+Sur MySQL, activity_log est partitionnée par mois (RANGE sur created_at) : un mois
+expiré est archivé puis supprimé par DROP PARTITION, sans DELETE massif.
+Ailleurs (SQLite), les lignes expirées sont supprimées par petits lots.
+Les archives sont des fichiers JSONL compressés (gzip), un par mois archivé.
+"""
+import gzip
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, inspect, select, text
+from models import db, ActivityLog
+from counters import adjust_counters, count_change
+from streaming import iter_rows
+from serializers import dumps
+
+TABLE = ActivityLog.__tablename__
+
+def month_start(moment):
+    """Premier jour du mois de moment (00:00)"""
+    return datetime(moment.year, moment.month, 1)
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+def retention_cutoff(retention_days, now=None):
+    """
+    Date avant laquelle les activités sont expirées
+    Arrondie au début du mois : seuls des mois complets sont archivés
+    """
+    return month_start((now or datetime.utcnow()) - timedelta(days=retention_days))
+
+def expired_months(cutoff):
+    """Mois [début, fin) contenant des activités antérieures à cutoff"""
+    oldest = db.session.scalar(select(func.min(ActivityLog.created_at)))
+    months = []
+    month = month_start(oldest) if oldest is not None else cutoff
+    while month < cutoff:
+        months.append((month, next_month(month)))
+        month = next_month(month)
+    return months
+
+# ==================== PARTITIONS MYSQL ====================
+
+def is_partitionable():
+    return db.engine.dialect.name == 'mysql'
+
+def mysql_partitions():
+    """Noms des partitions de activity_log (liste vide si la table n'est pas partitionnée)"""
+    return db.session.scalars(text(
+        'SELECT partition_name FROM information_schema.partitions '
+        'WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL '
+        'ORDER BY partition_ordinal_position'
+    ), {'table': TABLE}).all()
+
+def _partition_clauses(months):
+    clauses = [f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{next_month(month):%Y-%m-%d}'))"
+               for month in months]
+    clauses.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    return ', '.join(clauses)
+
+def _months_until(first, last):
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def partition_activity_log(months_ahead=3):
+    """
+    Convertit activity_log en table partitionnée par mois (MySQL uniquement)
+    MySQL impose la colonne de partitionnement dans la clé primaire, qui devient
+    (id, created_at), et n'accepte pas de clé étrangère sur une table partitionnée :
+    la contrainte vers user est supprimée (user_id reste indexé)
+    Retourne la liste des opérations effectuées
+    """
+    if not is_partitionable() or mysql_partitions():
+        return []
+    operations = []
+    with db.engine.begin() as connection:
+        for foreign_key in inspect(connection).get_foreign_keys(TABLE):
+            connection.exec_driver_sql(f'ALTER TABLE {TABLE} DROP FOREIGN KEY {foreign_key["name"]}')
+            operations.append(f'clé étrangère {foreign_key["name"]} supprimée')
+        connection.exec_driver_sql(f'UPDATE {TABLE} SET created_at = UTC_TIMESTAMP() WHERE created_at IS NULL')
+        connection.exec_driver_sql(
+            f'ALTER TABLE {TABLE} MODIFY created_at DATETIME NOT NULL, '
+            f'DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)'
+        )
+        oldest = connection.scalar(select(func.min(ActivityLog.created_at)))
+        now = month_start(datetime.utcnow())
+        last = now
+        for _ in range(months_ahead):
+            last = next_month(last)
+        months = _months_until(month_start(oldest or now), last)
+        connection.exec_driver_sql(
+            f'ALTER TABLE {TABLE} PARTITION BY RANGE (TO_DAYS(created_at)) ({_partition_clauses(months)})'
+        )
+        operations.append(f'{TABLE} partitionnée ({len(months)} mois)')
+    return operations
+
+def ensure_partitions(months_ahead=3):
+    """
+    Crée à l'avance les partitions des prochains mois (découpe de pmax, vide)
+    Retourne les noms des partitions créées
+    """
+    existing = mysql_partitions() if is_partitionable() else []
+    if 'pmax' not in existing:
+        return []
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    bounded = [name for name in existing if name != 'pmax']
+    first = next_month(datetime.strptime(bounded[-1], 'p%Y%m')) if bounded else month_start(datetime.utcnow())
+    months = _months_until(first, last)
+    if months:
+        db.session.execute(text(
+            f'ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO ({_partition_clauses(months)})'
+        ))
+        db.session.commit()
+    return [partition_name(month) for month in months]
+
+# ==================== ARCHIVAGE ====================
+
+def _month_filter(start, end):
+    return (ActivityLog.created_at >= start) & (ActivityLog.created_at < end)
+
+def write_archive(start, end, archive_dir, chunk_size):
+    """
+    Écrit les activités du mois [start, end) dans un fichier JSONL compressé
+    Les lignes sont lues en flux (curseur serveur), jamais toutes en mémoire
+    Le nom contient l'heure de l'archivage : une reprise après interruption
+    n'écrase jamais une archive précédente (les doublons se repèrent par id)
+    Retourne (chemin, nombre de lignes), chemin None si le mois est vide
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{TABLE}-{start:%Y-%m}-{datetime.utcnow():%Y%m%dT%H%M%S}.jsonl.gz')
+    query = select(ActivityLog.__table__).where(_month_filter(start, end)).order_by(
+        ActivityLog.created_at, ActivityLog.id
+    )
+    count = 0
+    with gzip.open(path + '.part', 'wb') as archive:
+        for row in iter_rows(query, chunk_size):
+            archive.write(dumps(dict(row._mapping)) + b'\n')
+            count += 1
+    if not count:
+        os.remove(path + '.part')
+        return None, 0
+    os.replace(path + '.part', path)
+    return path, count
+
+def purge_month(start, end, chunk_size):
+    """
+    Supprime les activités du mois [start, end) et décrémente les compteurs
+    DROP PARTITION si le mois a sa partition MySQL, sinon DELETE par lots de
+    chunk_size lignes (une transaction courte par lot)
+    Retourne le nombre de lignes supprimées
+    """
+    deltas = {}
+    if partition_name(start) in (mysql_partitions() if is_partitionable() else []):
+        counts = db.session.execute(
+            select(ActivityLog.user_id, func.count()).where(_month_filter(start, end)).group_by(ActivityLog.user_id)
+        ).all()
+        for user_id, count in counts:
+            count_change(deltas, ActivityLog, -count, user_id)
+        db.session.execute(text(f'ALTER TABLE {TABLE} DROP PARTITION {partition_name(start)}'))
+        adjust_counters(db.session, deltas)
+        db.session.commit()
+        return sum(count for _, count in counts)
+
+    deleted = 0
+    while True:
+        rows = db.session.execute(
+            select(ActivityLog.id, ActivityLog.user_id).where(_month_filter(start, end)).order_by(
+                ActivityLog.created_at
+            ).limit(chunk_size)
+        ).all()
+        if not rows:
+            return deleted
+        deltas = {}
+        for _, user_id in rows:
+            count_change(deltas, ActivityLog, -1, user_id)
+        db.session.execute(delete(ActivityLog).where(ActivityLog.id.in_([row.id for row in rows])))
+        adjust_counters(db.session, deltas)
+        db.session.commit()
+        deleted += len(rows)
+
+def archive_activity(retention_days, archive_dir, chunk_size=5000, dry_run=False):
+    """
+    Archive puis supprime les mois expirés, du plus ancien au plus récent
+    Chaque mois est archivé avant d'être supprimé : une interruption laisse au pire
+    une archive en double, jamais de ligne perdue
+    Retourne [(mois, chemin de l'archive, lignes archivées, lignes supprimées)]
+    """
+    results = []
+    for start, end in expired_months(retention_cutoff(retention_days)):
+        if dry_run:
+            count = db.session.scalar(select(func.count(ActivityLog.id)).where(_month_filter(start, end)))
+            results.append((start, None, count, 0))
+            continue
+        path, archived = write_archive(start, end, archive_dir, chunk_size)
+        deleted = purge_month(start, end, chunk_size)
+        results.append((start, path, archived, deleted))
+    return results
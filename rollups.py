@@ -0,0 +1,139 @@
+"""
+Agrégats du journal d'activité par heure et par jour
+Chaque nouvelle activité incrémente ses périodes (granularity, action, bucket, user_id)
+dans la transaction qui l'écrit : une série temporelle se lit en O(périodes), sans
+parcourir ActivityLog. Les agrégats survivent à l'archivage des activités brutes.
+"""
+from datetime import timedelta
+from sqlalchemy import delete, event, func, insert, literal, select
+from sqlalchemy.orm import Session
+from models import db, ActivityLog, ActivityRollup, increment_row
+
+# Granularités : (troncature d'une date, pas entre deux périodes)
+GRANULARITIES = {
+    'hour': (lambda moment: moment.replace(minute=0, second=0, microsecond=0), timedelta(hours=1)),
+    'day': (lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0), timedelta(days=1)),
+}
+
+# Nombre maximal de périodes d'une série
+MAX_BUCKETS = 2000
+
+# user_id des activités sans utilisateur
+NO_USER = 0
+
+def truncate(granularity, moment):
+    """Début de la période contenant moment"""
+    return GRANULARITIES[granularity][0](moment)
+
+def rollup_change(deltas, action, user_id, created_at, delta=1):
+    """Ajoute à deltas l'effet de delta activités (toutes granularités)"""
+    if created_at is None:
+        return
+    for granularity in GRANULARITIES:
+        key = (granularity, action, truncate(granularity, created_at), user_id or NO_USER)
+        deltas[key] = deltas.get(key, 0) + delta
+
+def adjust_rollups(session, deltas):
+    """
+    Applique {(granularity, action, bucket, user_id): delta} dans la transaction courante
+    À appeler explicitement après une insertion Core dans ActivityLog
+    """
+    table = ActivityRollup.__table__
+    connection = session.connection()
+    # Upsert atomique (première activité d'une période), dans un ordre fixe :
+    # pas d'interblocage entre transactions concurrentes
+    for (granularity, action, bucket, user_id), delta in sorted(deltas.items()):
+        if delta:
+            increment_row(connection, table, {
+                'granularity': granularity, 'action': action, 'bucket': bucket, 'user_id': user_id
+            }, {'count': delta})
+
+@event.listens_for(Session, 'after_flush')
+def _rollup_new_activities(session, flush_context):
+    """Activités écrites par l'ORM (journal synchrone, scripts)"""
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, ActivityLog):
+            rollup_change(deltas, obj.action, obj.user_id, obj.created_at)
+    if deltas:
+        adjust_rollups(session, deltas)
+
+# ==================== LECTURE ====================
+
+def activity_series_query(granularity, start, end, action=None, user_id=None):
+    """
+    Somme des agrégats par période sur [start, end) : une requête sur la clé primaire
+    (ou l'index (granularity, bucket) sans filtre d'action)
+    """
+    query = select(ActivityRollup.bucket, func.sum(ActivityRollup.count)).where(
+        ActivityRollup.granularity == granularity,
+        ActivityRollup.bucket >= start,
+        ActivityRollup.bucket < end
+    ).group_by(ActivityRollup.bucket)
+    if action:
+        query = query.where(ActivityRollup.action == action)
+    if user_id is not None:
+        query = query.where(ActivityRollup.user_id == user_id)
+    return query
+
+def activity_series(granularity, start, end, action=None, user_id=None):
+    """
+    Nombre d'activités par période sur [start, end), périodes vides incluses
+    Retourne [(début de période, nombre)]
+    """
+    start = truncate(granularity, start)
+    step = GRANULARITIES[granularity][1]
+    counts = dict(db.session.execute(activity_series_query(granularity, start, end, action, user_id)).all())
+
+    series = []
+    bucket = start
+    while bucket < end:
+        series.append((bucket, int(counts.get(bucket, 0))))
+        bucket += step
+    return series
+
+def bucket_count(granularity, start, end):
+    """Nombre de périodes de [start, end)"""
+    step = GRANULARITIES[granularity][1]
+    return max(0, -(-(end - truncate(granularity, start)) // step))
+
+# ==================== RECONSTRUCTION ====================
+
+def _bucket_expression(granularity, dialect):
+    """Début de période calculé en SQL, au format de stockage des dates du dialecte"""
+    column = ActivityLog.created_at
+    if dialect == 'mysql':
+        return func.date_format(column, '%Y-%m-%d %H:00:00' if granularity == 'hour' else '%Y-%m-%d 00:00:00')
+    if dialect == 'postgresql':
+        return func.date_trunc(granularity, column)
+    # SQLite : dates stockées en texte 'AAAA-MM-JJ HH:MM:SS.ffffff'
+    return func.strftime('%Y-%m-%d %H:00:00.000000' if granularity == 'hour' else '%Y-%m-%d 00:00:00.000000', column)
+
+def rebuild_rollups():
+    """
+    Recalcule les agrégats (INSERT ... SELECT GROUP BY) sur la période couverte par
+    les activités encore présentes ; les agrégats plus anciens (activités archivées)
+    sont conservés
+    Retourne le nombre de lignes d'agrégats écrites
+    """
+    oldest = db.session.scalar(select(func.min(ActivityLog.created_at)))
+    if oldest is None:
+        return 0
+    table = ActivityRollup.__table__
+    dialect = db.engine.dialect.name
+    written = 0
+    for granularity in GRANULARITIES:
+        db.session.execute(delete(table).where(
+            table.c.granularity == granularity, table.c.bucket >= truncate(granularity, oldest)
+        ))
+        bucket = _bucket_expression(granularity, dialect)
+        user_id = func.coalesce(ActivityLog.user_id, NO_USER)
+        result = db.session.execute(insert(table).from_select(
+            ['granularity', 'action', 'bucket', 'user_id', 'count'],
+            select(literal(granularity), ActivityLog.action, bucket, user_id, func.count()).where(
+                ActivityLog.created_at.isnot(None)
+            ).group_by(ActivityLog.action, bucket, user_id)
+        ))
+        written += result.rowcount
+    db.session.commit()
+    return written
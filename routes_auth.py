@@ -4,7 +4,8 @@ Gestion de l'inscription, connexion, déconnexion et profil utilisateur
 """
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User, Role, ActivityLog
+from models import db, User, Role
+from activity import log_activity
 from forms import LoginForm, RegisterForm
 from datetime import datetime
 
@@ -34,16 +35,10 @@ def register():
             user.roles.append(user_role)
         
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()  # attribue user.id
         
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=user.id,
-            action='register',
-            description=f'Nouvel utilisateur enregistré: {user.username}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec l'inscription
+        log_activity('register', f'Nouvel utilisateur enregistré: {user.username}', user)
         db.session.commit()
         
         flash('Inscription réussie ! Vous pouvez maintenant vous connecter.', 'success')
@@ -72,16 +67,9 @@ def login():
             
             # Mise à jour de la date de dernière connexion
             user.last_login = datetime.utcnow()
-            db.session.commit()
             
-            # Log de l'activité
-            log = ActivityLog(
-                user_id=user.id,
-                action='login',
-                description=f'Connexion de {user.username}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(log)
+            # Log de l'activité, validé avec la modification
+            log_activity('login', f'Connexion de {user.username}', user)
             db.session.commit()
             
             # Redirection vers la page demandée ou dashboard
@@ -101,13 +89,7 @@ def login():
 def logout():
     """Déconnexion de l'utilisateur"""
     # Log de l'activité
-    log = ActivityLog(
-        user_id=current_user.id,
-        action='logout',
-        description=f'Déconnexion de {current_user.username}',
-        ip_address=request.remote_addr
-    )
-    db.session.add(log)
+    log_activity('logout', f'Déconnexion de {current_user.username}')
     db.session.commit()
     
     logout_user()
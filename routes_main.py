@@ -2,14 +2,23 @@
 Routes principales de l'application
 Gestion des produits, uploads, dashboard
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_from_directory
+from flask import Blueprint, render_template, redirect, url_for, flash, request, send_from_directory, current_app, abort, make_response
 from flask_login import login_required, current_user
-from models import db, Product, FileUpload, User, ActivityLog
+from models import db, Product, FileUpload, User, ActivityLog, get_catalog_version
+from cache import product_cache, product_cache_key
+from search import search_products
+from facets import get_facets, category_facet
+from pagination import keyset_page
+from counters import GLOBAL, get_counters
+from query_stats import query_budget
+from summary import recent_items
+from activity import log_activity
+from chunked_upload import save_stream
+from storage import store_upload, temp_path
 from forms import ProductForm, FileUploadForm
 from werkzeug.utils import secure_filename
-import os
-from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
 
 main_bp = Blueprint('main', __name__)
 
@@ -20,20 +29,23 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@query_budget(6)
 def dashboard():
     """Dashboard avec statistiques - Admin ou User"""
     # Si l'utilisateur est admin, afficher le dashboard admin complet
     if current_user.has_role('admin'):
         # Récupérer les statistiques globales
+        # Compteurs précalculés (une lecture par clé primaire)
+        counters = get_counters(GLOBAL)
         stats = {
-            'total_users': User.query.count(),
-            'total_products': Product.query.count(),
-            'total_uploads': FileUpload.query.count(),
-            'total_activities': ActivityLog.query.count(),
+            'total_users': counters['users'],
+            'total_products': counters['products'],
+            'total_uploads': counters['uploads'],
+            'total_activities': counters['activities'],
         }
         
         # Activités récentes (toutes)
-        recent_activities = ActivityLog.query.order_by(
+        recent_activities = ActivityLog.query.options(joinedload(ActivityLog.user)).order_by(
             ActivityLog.created_at.desc()
         ).limit(10).all()
         
@@ -45,80 +57,137 @@ def dashboard():
             'user': log.user.username if log.user else 'System'
         } for log in recent_activities]
         
-        # Produits par catégorie
-        category_stats = db.session.query(
-            Product.category,
-            func.count(Product.id).label('count')
-        ).filter(Product.category.isnot(None)).group_by(Product.category).all()
-        
-        stats['products_by_category'] = {cat: count for cat, count in category_stats if cat}
+        # Produits par catégorie (compteurs de la table Category)
+        stats['products_by_category'] = {
+            facet['value']: facet['count'] for facet in category_facet()
+        }
         
-        return render_template('admin_dashboard.html', stats=stats)
+        # La version du catalogue identifie le fragment en cache des catégories
+        catalog_version, _ = get_catalog_version()
+        return render_template('admin_dashboard.html', stats=stats, catalog_version=catalog_version)
     
     # Sinon, afficher le dashboard utilisateur personnalisé
     else:
         # Statistiques personnelles de l'utilisateur
+        counters = get_counters(current_user.id)
         stats = {
-            'my_products': Product.query.filter_by(user_id=current_user.id).count(),
-            'my_uploads': FileUpload.query.filter_by(user_id=current_user.id).count(),
-            'my_activities': ActivityLog.query.filter_by(user_id=current_user.id).count(),
+            'my_products': counters['products'],
+            'my_uploads': counters['uploads'],
+            'my_activities': counters['activities'],
             'member_since': current_user.created_at.strftime('%d/%m/%Y') if current_user.created_at else 'N/A'
         }
         
-        # Produits récents de l'utilisateur
-        stats['recent_products'] = Product.query.filter_by(
-            user_id=current_user.id
-        ).order_by(Product.created_at.desc()).limit(5).all()
-        
-        # Activités récentes de l'utilisateur
-        recent_activities = ActivityLog.query.filter_by(
-            user_id=current_user.id
-        ).order_by(ActivityLog.created_at.desc()).limit(10).all()
-        
-        stats['my_recent_activities'] = [{
-            'id': log.id,
-            'action': log.action,
-            'description': log.description,
-            'created_at': log.created_at.strftime('%d/%m/%Y %H:%M') if log.created_at else ''
-        } for log in recent_activities]
-        
-        # Fichiers récents de l'utilisateur
-        stats['recent_uploads'] = FileUpload.query.filter_by(
-            user_id=current_user.id
-        ).order_by(FileUpload.uploaded_at.desc()).limit(5).all()
+        # Produits, activités et fichiers récents en une seule requête (UNION ALL)
+        recent = recent_items(current_user.id)
+        stats['recent_products'] = recent['products']
+        stats['my_recent_activities'] = [dict(
+            activity,
+            created_at=activity['created_at'].strftime('%d/%m/%Y %H:%M') if activity['created_at'] else ''
+        ) for activity in recent['activities']]
+        stats['recent_uploads'] = recent['uploads']
         
         return render_template('user_dashboard.html', stats=stats)
 
 # ==================== ROUTES PRODUCTS ====================
 
+# Longueur de l'extrait de description affiché sur les cartes produits
+SNIPPET_LENGTH = 100
+
+def product_card_query():
+    """
+    SELECT limité aux colonnes affichées par les cartes produits
+    L'extrait de description est calculé en SQL : le texte complet n'est jamais transféré
+    """
+    return select(
+        Product.id, Product.name, Product.price, Product.stock, Product.category,
+        Product.image_url, Product.user_id, Product.created_at, Product.updated_at, Product.version,
+        func.substr(Product.description, 1, SNIPPET_LENGTH).label('snippet'),
+        (func.length(func.substr(Product.description, SNIPPET_LENGTH + 1, 1)) > 0).label('truncated')
+    )
+
+def _load_product_page(search, category, cursor, offset, page_size):
+    """
+    Charge une page de cartes produits
+    Sans recherche : pagination par curseur sur (created_at, id) décroissant
+    Avec recherche : pagination par position (offset) dans la liste classée par pertinence
+    Retourne (cartes, paramètres de la page suivante ou None)
+    """
+    query = product_card_query()
+    if category:
+        query = query.where(Product.category == category)
+    
+    if not search:
+        rows, next_cursor = keyset_page(
+            query, Product.created_at, Product.id, page_size, cursor or None, descending=True
+        )
+        next_page = {'cursor': next_cursor} if next_cursor else None
+        return [dict(row._mapping) for row in rows], next_page
+    
+    # Recherche plein texte : résultats classés par pertinence
+    ranked = [product_id for product_id, _ in
+              search_products(search, current_app.config['SEARCH_MAX_RESULTS'])]
+    if category and ranked:
+        in_category = set(db.session.scalars(
+            select(Product.id).where(Product.id.in_(ranked), Product.category == category)
+        ))
+        ranked = [product_id for product_id in ranked if product_id in in_category]
+    
+    page_ids = ranked[offset:offset + page_size]
+    if not page_ids:
+        return [], None
+    
+    rank = {product_id: position for position, product_id in enumerate(page_ids)}
+    rows = db.session.execute(query.where(Product.id.in_(page_ids))).all()
+    rows.sort(key=lambda row: rank[row.id])
+    next_offset = offset + page_size
+    next_page = {'offset': next_offset} if next_offset < len(ranked) else None
+    return [dict(row._mapping) for row in rows], next_page
+
 @main_bp.route('/products')
 @login_required
+@query_budget(10)
 def products():
-    """Liste des produits avec recherche et filtres"""
+    """
+    Liste des produits avec recherche et filtres, paginée par curseur
+    (par position dans les résultats classés en cas de recherche)
+    Avec fragment=1, ne renvoie que les cartes de la page (défilement infini)
+    """
     search = request.args.get('search', '')
     category = request.args.get('category', '')
+    cursor = '' if search else request.args.get('cursor', '')
+    offset = request.args.get('offset', '0') if search else '0'
+    if not offset.isdigit():
+        abort(404)
+    offset = int(offset)
+    page_size = current_app.config['PRODUCTS_PAGE_SIZE']
     
-    query = Product.query
-    
-    # Filtres
-    if search:
-        query = query.filter(
-            (Product.name.ilike(f'%{search}%')) | 
-            (Product.description.ilike(f'%{search}%'))
+    # Les combinaisons de filtres fréquentes sont servies depuis le cache mémoire
+    version, _ = get_catalog_version()
+    try:
+        products, next_page = product_cache.get_or_set(
+            product_cache_key('html', search, category, cursor, offset, version=version),
+            lambda: _load_product_page(search, category, cursor, offset, page_size)
         )
+    except ValueError:
+        abort(404)
     
-    if category:
-        query = query.filter_by(category=category)
+    next_url = None
+    if next_page:
+        next_url = url_for('main.products', search=search or None, category=category or None,
+                           **next_page)
     
-    products = query.order_by(Product.created_at.desc()).all()
+    if request.args.get('fragment'):
+        response = make_response(render_template('products/_cards.html', products=products))
+        if next_url:
+            response.headers['X-Next-Page'] = next_url
+        return response
     
-    # Liste des catégories pour le filtre
-    categories = db.session.query(Product.category).distinct().filter(
-        Product.category.isnot(None)
-    ).all()
-    categories = [cat[0] for cat in categories if cat[0]]
+    # Catégories du filtre avec leur nombre de produits : compteurs de la table
+    # Category, ou facettes du contexte de recherche
+    categories = get_facets(search)['categories'] if search else category_facet()
     
-    return render_template('products/list.html', products=products, categories=categories)
+    return render_template('products/list.html', products=products, categories=categories,
+                           next_url=next_url)
 
 @main_bp.route('/products/create', methods=['GET', 'POST'])
 @login_required
@@ -138,16 +207,9 @@ def create_product():
         )
         
         db.session.add(product)
-        db.session.commit()
         
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=current_user.id,
-            action='create_product',
-            description=f'Produit créé: {product.name}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec la modification
+        log_activity('create_product', f'Produit créé: {product.name}')
         db.session.commit()
         
         flash('Produit créé avec succès !', 'success')
@@ -157,6 +219,7 @@ def create_product():
 
 @main_bp.route('/products/<int:product_id>')
 @login_required
+@query_budget(4)
 def view_product(product_id):
     """Voir les détails d'un produit"""
     product = Product.query.get_or_404(product_id)
@@ -183,16 +246,8 @@ def edit_product(product_id):
         product.category = form.category.data
         product.image_url = form.image_url.data
         
-        db.session.commit()
-        
-        # Log de l'activité
-        log = ActivityLog(
-            user_id=current_user.id,
-            action='update_product',
-            description=f'Produit mis à jour: {product.name}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
+        # Log de l'activité, validé avec la modification
+        log_activity('update_product', f'Produit mis à jour: {product.name}')
         db.session.commit()
         
         flash('Produit mis à jour avec succès !', 'success')
@@ -213,16 +268,9 @@ def delete_product(product_id):
     
     product_name = product.name
     db.session.delete(product)
-    db.session.commit()
     
-    # Log de l'activité
-    log = ActivityLog(
-        user_id=current_user.id,
-        action='delete_product',
-        description=f'Produit supprimé: {product_name}',
-        ip_address=request.remote_addr
-    )
-    db.session.add(log)
+    # Log de l'activité, validé avec la modification
+    log_activity('delete_product', f'Produit supprimé: {product_name}')
     db.session.commit()
     
     flash('Produit supprimé avec succès !', 'success')
@@ -243,39 +291,20 @@ def upload_file():
             # Sécuriser le nom du fichier
             filename = secure_filename(file.filename)
             
-            # Créer un nom unique avec timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
+            # Copie unique du fichier reçu, taille et SHA-256 calculés pendant l'écriture
+            file_path = temp_path()
+            file_size, sha256 = save_stream(file.stream, file_path, current_app.config['MAX_CONTENT_LENGTH'])
             
-            # Créer le dossier uploads s'il n'existe pas
-            upload_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            # Sauvegarder le fichier
-            file_path = os.path.join(upload_folder, unique_filename)
-            file.save(file_path)
-            
-            # Enregistrer dans la base de données
-            file_upload = FileUpload(
-                filename=unique_filename,
+            # Enregistrer dans la base de données (un contenu déjà stocké n'est pas réécrit)
+            store_upload(
+                file_path, sha256, file_size,
                 original_filename=filename,
-                file_path=file_path,
-                file_size=os.path.getsize(file_path),
                 mime_type=file.content_type,
                 user_id=current_user.id
             )
             
-            db.session.add(file_upload)
-            db.session.commit()
-            
-            # Log de l'activité
-            log = ActivityLog(
-                user_id=current_user.id,
-                action='upload_file',
-                description=f'Fichier uploadé: {filename}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(log)
+            # Log de l'activité, validé avec la modification
+            log_activity('upload_file', f'Fichier uploadé: {filename}')
             db.session.commit()
             
             flash('Fichier uploadé avec succès !', 'success')
@@ -302,11 +331,11 @@ def download_file(file_id):
         flash('Vous n\'avez pas la permission de télécharger ce fichier.', 'danger')
         return redirect(url_for('main.upload_file'))
     
-    upload_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-    
+    # filename est relatif à UPLOAD_FOLDER (ab/cd/<sha256>, ou nom à plat avant migration)
     return send_from_directory(
-        upload_folder, 
+        current_app.config['UPLOAD_FOLDER'], 
         file_upload.filename, 
+        mimetype=file_upload.mime_type,
         as_attachment=True,
         download_name=file_upload.original_filename
     )
@@ -322,26 +351,13 @@ def delete_file(file_id):
         flash('Vous n\'avez pas la permission de supprimer ce fichier.', 'danger')
         return redirect(url_for('main.upload_file'))
     
-    # Supprimer le fichier physique
-    try:
-        if os.path.exists(file_upload.file_path):
-            os.remove(file_upload.file_path)
-    except Exception as e:
-        flash(f'Erreur lors de la suppression du fichier: {str(e)}', 'danger')
-    
-    # Supprimer de la base de données
+    # Supprimer de la base de données ; le fichier n'est supprimé qu'après le commit,
+    # et seulement s'il n'est plus partagé par un autre upload (voir storage.py)
     filename = file_upload.original_filename
     db.session.delete(file_upload)
-    db.session.commit()
     
-    # Log de l'activité
-    log = ActivityLog(
-        user_id=current_user.id,
-        action='delete_file',
-        description=f'Fichier supprimé: {filename}',
-        ip_address=request.remote_addr
-    )
-    db.session.add(log)
+    # Log de l'activité, validé avec la modification
+    log_activity('delete_file', f'Fichier supprimé: {filename}')
     db.session.commit()
     
     flash('Fichier supprimé avec succès !', 'success')
@@ -0,0 +1,103 @@
+"""
+Mise à niveau du schéma d'une base existante
+Crée les tables et index déclarés dans les modèles qui manquent encore,
+sans toucher aux données (MySQL et SQLite)
+"""
+from sqlalchemy import inspect
+from sqlalchemy.schema import AddConstraint, CreateColumn
+from models import db, refresh_categories
+from search import ensure_search_schema
+from counters import reconcile_counters
+from rollups import rebuild_rollups
+
+def missing_indexes():
+    """Liste les index déclarés dans les modèles absents de la base"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+def missing_columns():
+    """Liste les colonnes déclarées dans les modèles absentes des tables existantes"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+def add_column(column):
+    """
+    Ajoute une colonne à une table existante (ALTER TABLE ... ADD COLUMN)
+    La clé étrangère est ajoutée séparément, sauf sur SQLite qui ne le permet pas
+    """
+    table = column.table
+    with db.engine.begin() as connection:
+        spec = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {spec}')
+        if connection.dialect.name != 'sqlite':
+            for foreign_key in column.foreign_keys:
+                connection.execute(AddConstraint(foreign_key.constraint))
+
+def backfill_categories():
+    """
+    Crée les catégories manquantes, rattache chaque produit à la sienne
+    et recalcule tous les compteurs
+    Retourne le nombre de catégories
+    """
+    count = refresh_categories(db.session)
+    db.session.commit()
+    return count
+
+def upgrade_schema(echo=print):
+    """
+    Applique les changements de schéma de façon idempotente
+    Retourne la liste des opérations effectuées
+    """
+    operations = []
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    # Nouvelles tables (avec leurs index)
+    new_tables = [table for table in db.metadata.sorted_tables if table.name not in existing_tables]
+    if new_tables:
+        db.metadata.create_all(db.engine, tables=new_tables)
+        operations.extend(f'table {table.name}' for table in new_tables)
+
+    # Nouvelles colonnes sur les tables existantes
+    added = missing_columns()
+    for column in added:
+        add_column(column)
+        operations.append(f'colonne {column.table.name}.{column.name}')
+
+    # Nouveaux index sur les tables existantes (DDL en ligne sur InnoDB)
+    for index in missing_indexes():
+        index.create(db.engine)
+        operations.append(f'index {index.name} sur {index.table.name}')
+    
+    # Structures de recherche plein texte (FULLTEXT MySQL / FTS5 SQLite)
+    operations.extend(ensure_search_schema(db.engine))
+
+    for operation in operations:
+        echo(f'✓ Créé: {operation}')
+
+    # Compteurs des tableaux de bord initialisés depuis les données existantes
+    if any(table.name == 'stat_counter' for table in new_tables):
+        echo(f'✓ Compteurs initialisés: {len(reconcile_counters())}')
+
+    # Agrégats d'activité calculés depuis le journal existant
+    if any(table.name == 'activity_rollup' for table in new_tables):
+        echo(f'✓ Agrégats d\'activité initialisés: {rebuild_rollups()}')
+
+    # Rattachement des produits existants à la table Category
+    if any(column.table.name == 'product' and column.name == 'category_id' for column in added):
+        echo(f'✓ Catégories initialisées: {backfill_categories()}')
+    return operations
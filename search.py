@@ -0,0 +1,236 @@
+"""
+Moteur de recherche plein texte des produits
+Classement par pertinence et recherche insensible aux accents :
+- MySQL : index FULLTEXT (MATCH ... AGAINST)
+- SQLite : table virtuelle FTS5 maintenue par triggers
+- autres bases : index inversé en mémoire, reconstruit après chaque écriture
+"""
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from sqlalchemy import inspect, select, text
+from models import db, Product, catalog_changed
+from query_stats import uncounted
+
+FULLTEXT_INDEX = 'ft_product_name_description'
+FTS_TABLE = 'product_fts'
+
+# Poids du nom par rapport à la description dans le score de pertinence
+NAME_WEIGHT = 3.0
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+def normalize(value):
+    """Met en minuscules et retire les accents (é -> e, ç -> c)"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def tokenize(value):
+    """Découpe un texte en mots normalisés"""
+    return _WORD_RE.findall(normalize(value))
+
+# ==================== BACKENDS ====================
+
+class MySQLFulltextBackend:
+    """Recherche via l'index FULLTEXT de MySQL (collation insensible aux accents)"""
+    name = 'mysql-fulltext'
+
+    def search(self, query, limit):
+        words = _WORD_RE.findall(query.lower())
+        if not words:
+            return []
+        # Mode booléen : tous les mots requis, le dernier en préfixe (saisie en cours)
+        boolean_query = ' '.join(f'+{word}' for word in words[:-1]) + f' +{words[-1]}*'
+        rows = db.session.execute(text(
+            'SELECT id, MATCH(name, description) AGAINST (:natural) AS score '
+            'FROM product WHERE MATCH(name, description) AGAINST (:boolean IN BOOLEAN MODE) '
+            'ORDER BY score DESC, id DESC LIMIT :limit'
+        ), {'natural': query, 'boolean': boolean_query, 'limit': limit})
+        return [(row.id, float(row.score)) for row in rows]
+
+class SQLiteFTSBackend:
+    """Recherche via la table FTS5 (tokenizer unicode61 sans diacritiques, score bm25)"""
+    name = 'sqlite-fts5'
+
+    def search(self, query, limit):
+        words = tokenize(query)
+        if not words:
+            return []
+        # Chaque mot entre guillemets (pas d'opérateurs FTS), le dernier en préfixe
+        match = ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        rows = db.session.execute(text(
+            f'SELECT rowid AS id, bm25({FTS_TABLE}, {NAME_WEIGHT}, 1.0) AS score '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match '
+            f'ORDER BY score, rowid DESC LIMIT :limit'
+        ), {'match': match, 'limit': limit})
+        # bm25 renvoie des scores négatifs : plus petit = plus pertinent
+        return [(row.id, -float(row.score)) for row in rows]
+
+class InvertedIndexBackend:
+    """
+    Index inversé en mémoire (mot -> {id produit: poids})
+    Construit à la première recherche et invalidé à chaque modification du catalogue
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._terms = []
+        self._documents = 0
+
+    def invalidate(self):
+        """Force la reconstruction de l'index à la prochaine recherche"""
+        with self._lock:
+            self._postings = None
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        documents = 0
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.description),
+            execution_options={'yield_per': 1000}
+        )
+        for product_id, name, description in rows:
+            documents += 1
+            for word in tokenize(name):
+                postings[word][product_id] += NAME_WEIGHT
+            for word in tokenize(description):
+                postings[word][product_id] += 1.0
+        self._postings = {word: dict(ids) for word, ids in postings.items()}
+        self._terms = sorted(self._postings)
+        self._documents = documents
+
+    def _matches(self, word, prefix):
+        """Poids par produit pour un mot (ou tous les mots commençant par ce préfixe)"""
+        if not prefix:
+            return self._postings.get(word, {})
+        merged = defaultdict(float)
+        position = bisect_left(self._terms, word)
+        while position < len(self._terms) and self._terms[position].startswith(word):
+            for product_id, weight in self._postings[self._terms[position]].items():
+                merged[product_id] = max(merged[product_id], weight)
+            position += 1
+        return merged
+
+    def search(self, query, limit):
+        words = tokenize(query)
+        if not words:
+            return []
+        with self._lock:
+            if self._postings is None:
+                self._build()
+            scores = None
+            for position, word in enumerate(words):
+                matches = self._matches(word, prefix=position == len(words) - 1)
+                # Pondération TF-IDF : les mots rares comptent davantage
+                idf = math.log(1 + self._documents / (1 + len(matches)))
+                weighted = {product_id: weight * idf for product_id, weight in matches.items()}
+                if scores is None:
+                    scores = weighted
+                else:
+                    scores = {product_id: score + weighted[product_id]
+                              for product_id, score in scores.items() if product_id in weighted}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit]
+
+_memory_backend = InvertedIndexBackend()
+_backend = None
+
+@catalog_changed.connect
+def _invalidate_memory_index(sender, **kwargs):
+    """L'index en mémoire est reconstruit après chaque écriture sur les produits"""
+    _memory_backend.invalidate()
+
+# ==================== MISE EN PLACE ====================
+
+def fulltext_available(engine):
+    """Indique si la base possède la structure de recherche native (FULLTEXT ou FTS5)"""
+    inspector = inspect(engine)
+    if engine.dialect.name == 'mysql':
+        return any(index['name'] == FULLTEXT_INDEX for index in inspector.get_indexes('product'))
+    if engine.dialect.name == 'sqlite':
+        # La table FTS5 n'est utilisable que si les triggers de synchronisation existent
+        with engine.connect() as connection:
+            triggers = connection.exec_driver_sql(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'product_fts_%'"
+            ).scalar()
+        return FTS_TABLE in inspector.get_table_names() and triggers == 3
+    return False
+
+def ensure_search_schema(engine):
+    """
+    Crée l'index FULLTEXT (MySQL) ou la table FTS5 et ses triggers (SQLite)
+    Retourne la liste des opérations effectuées
+    """
+    global _backend
+    if fulltext_available(engine):
+        return []
+
+    with engine.begin() as connection:
+        if engine.dialect.name == 'mysql':
+            connection.exec_driver_sql(
+                f'ALTER TABLE product ADD FULLTEXT INDEX {FULLTEXT_INDEX} (name, description)'
+            )
+        elif engine.dialect.name == 'sqlite':
+            connection.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(name, description, "
+                f"content='product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            connection.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN '
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                f'VALUES (new.id, new.name, new.description); END'
+            )
+            connection.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN '
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); END"
+            )
+            connection.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN '
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); "
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                f'VALUES (new.id, new.name, new.description); END'
+            )
+            # Indexation des produits existants
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        else:
+            return []
+
+    _backend = None
+    return ['index FULLTEXT' if engine.dialect.name == 'mysql' else f'table {FTS_TABLE}']
+
+def get_backend():
+    """
+    Choisit le backend de recherche selon la base (détection mise en cache)
+    Les requêtes de détection sur le catalogue ne comptent pas dans le budget de la vue
+    """
+    global _backend
+    if _backend is None:
+        engine = db.engine
+        with uncounted():
+            available = fulltext_available(engine)
+        if available:
+            if engine.dialect.name == 'mysql':
+                _backend = MySQLFulltextBackend()
+            else:
+                _backend = SQLiteFTSBackend()
+        else:
+            _backend = _memory_backend
+    return _backend
+
+def search_products(query, limit=100):
+    """
+    Recherche des produits par pertinence
+    Retourne une liste [(id produit, score)] triée du plus au moins pertinent
+    """
+    if not query or not query.strip():
+        return []
+    return get_backend().search(query.strip(), limit)
@@ -0,0 +1,109 @@
+"""
+Sérialisation rapide des lignes pour l'API REST
+Travaille directement sur les tuples Core (sans hydratation ORM ni identity map)
+et utilise orjson lorsqu'il est installé, json de la bibliothèque standard sinon
+"""
+import json
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import select
+from models import db, Product, FileUpload, User, Role, user_roles
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    orjson = None
+
+def _default(value):
+    """Conversion des types non natifs pour le module json standard"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Type non sérialisable: {type(value).__name__}')
+
+if orjson is not None:
+    def dumps(obj):
+        """Encode en JSON (bytes) ; orjson gère nativement les dates ISO 8601"""
+        return orjson.dumps(obj, default=_default)
+else:
+    def dumps(obj):
+        """Encode en JSON (bytes) avec la bibliothèque standard"""
+        return json.dumps(obj, default=_default, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+def json_response(payload, status=200):
+    """Équivalent de jsonify() utilisant l'encodeur rapide"""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+class RowSerializer:
+    """
+    Sérialiseur d'un modèle à partir de lignes Core
+    fields: champs API à produire (API_FIELDS du modèle par défaut)
+    extra: colonnes lues en plus sans être renvoyées (ex: clé de tri du curseur)
+    """
+
+    def __init__(self, model, fields=None, extra=()):
+        self.model = model
+        self.fields = tuple(field for field in (fields or model.API_FIELDS)
+                            if field in model.__table__.columns)
+        table = model.__table__
+        self.columns = [table.c[field] for field in self.fields]
+        self.columns += [column for column in extra if column.key not in self.fields]
+        self._width = len(self.fields)
+
+    def select(self):
+        """SELECT limité aux colonnes nécessaires"""
+        return select(*self.columns)
+
+    def to_dict(self, row):
+        """Convertit une ligne en dictionnaire (les dates sont gérées par l'encodeur)"""
+        return dict(zip(self.fields, row[:self._width]))
+
+    def serialize(self, rows):
+        """Convertit une liste de lignes en liste de dictionnaires"""
+        fields, width = self.fields, self._width
+        return [dict(zip(fields, row[:width])) for row in rows]
+
+class UserSerializer(RowSerializer):
+    """Sérialiseur des utilisateurs : les rôles sont chargés en une seule requête groupée"""
+
+    def __init__(self, fields=None, extra=()):
+        fields = fields or User.API_FIELDS
+        self.with_roles = 'roles' in fields
+        # L'identifiant est nécessaire pour rattacher les rôles
+        extra = tuple(extra) + ((User.__table__.c.id,) if self.with_roles else ())
+        super().__init__(User, fields, extra)
+
+    def serialize(self, rows):
+        data = super().serialize(rows)
+        if not self.with_roles or not rows:
+            return data
+
+        id_index = self.columns.index(User.__table__.c.id)
+        user_ids = [row[id_index] for row in rows]
+        roles = {}
+        for user_id, role_name in db.session.execute(
+            select(user_roles.c.user_id, Role.name)
+            .join(Role, Role.id == user_roles.c.role_id)
+            .where(user_roles.c.user_id.in_(user_ids))
+        ):
+            roles.setdefault(user_id, []).append(role_name)
+
+        for item, user_id in zip(data, user_ids):
+            item['roles'] = roles.get(user_id, [])
+        return data
+
+    def to_dict(self, row):
+        return self.serialize([row])[0]
+
+def product_serializer(fields=None):
+    """Sérialiseur des produits (created_at et id toujours lus pour la pagination)"""
+    table = Product.__table__
+    return RowSerializer(Product, fields, extra=(table.c.created_at, table.c.id))
+
+def upload_serializer(fields=None):
+    """Sérialiseur des fichiers uploadés"""
+    return RowSerializer(FileUpload, fields, extra=(FileUpload.__table__.c.id,))
+
+def user_serializer(fields=None):
+    """Sérialiseur des utilisateurs"""
+    return UserSerializer(fields)
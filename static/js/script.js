@@ -20,6 +20,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Effet de particules sur le fond
     createParticles();
     
+    // Défilement infini de la liste des produits
+    initInfiniteScroll();
+    
     // Animation smooth scroll
     document.querySelectorAll('a[href^="#"]').forEach(anchor => {
         anchor.addEventListener('click', function (e) {
@@ -35,6 +38,47 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Défilement infini de la liste des produits (fragments HTML paginés par curseur)
+function initInfiniteScroll() {
+    const container = document.getElementById('products-container');
+    const sentinel = document.getElementById('products-sentinel');
+    if (!container || !sentinel || !('IntersectionObserver' in window)) return;
+    
+    let loading = false;
+    
+    const loadNextPage = async () => {
+        const nextUrl = sentinel.dataset.nextUrl;
+        if (loading || !nextUrl) return;
+        loading = true;
+        try {
+            const separator = nextUrl.includes('?') ? '&' : '?';
+            const response = await fetch(`${nextUrl}${separator}fragment=1`, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            container.insertAdjacentHTML('beforeend', await response.text());
+            
+            const following = response.headers.get('X-Next-Page');
+            if (following) {
+                sentinel.dataset.nextUrl = following;
+                sentinel.querySelector('a').href = following;
+            } else {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Erreur de chargement des produits:', error);
+        } finally {
+            loading = false;
+        }
+    };
+    
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+    }, { rootMargin: '400px' });
+    observer.observe(sentinel);
+}
+
 // Fonction utilitaire pour les requêtes AJAX
 async function apiRequest(url, method = 'GET', data = null) {
     const options = {
@@ -259,6 +303,40 @@ function displayProducts(products) {
     `).join('');
 }
 
+// Autocomplétion de la recherche de produits (index en mémoire côté serveur)
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.querySelector('input[data-suggest-url]');
+    if (!input) return;
+    
+    const datalist = document.getElementById(input.getAttribute('list'));
+    let suggestTimeout;
+    let lastQuery = '';
+    
+    input.addEventListener('input', function() {
+        clearTimeout(suggestTimeout);
+        const query = input.value.trim();
+        if (query.length < 2 || query === lastQuery) return;
+        
+        suggestTimeout = setTimeout(async () => {
+            lastQuery = query;
+            try {
+                const url = `${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}&limit=8`;
+                const data = await apiRequest(url);
+                if (!data.success) return;
+                datalist.innerHTML = '';
+                data.suggestions.forEach(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = suggestion.value;
+                    option.label = suggestion.type === 'category' ? 'Catégorie' : 'Produit';
+                    datalist.appendChild(option);
+                });
+            } catch (error) {
+                console.error('Erreur d\'autocomplétion:', error);
+            }
+        }, 150);
+    });
+});
+
 // Animation smooth scroll
 document.querySelectorAll('a[href^="#"]').forEach(anchor => {
     anchor.addEventListener('click', function (e) {
@@ -272,9 +350,81 @@ document.querySelectorAll('a[href^="#"]').forEach(anchor => {
     });
 });
 
+// Tableau de bord en temps réel : événements poussés par le serveur (SSE)
+const COUNTER_ELEMENTS = {
+    users: 'total-users',
+    products: 'total-products',
+    uploads: 'total-uploads',
+    activities: 'total-activities'
+};
+
+function activityIcon(action) {
+    if (action.includes('create')) return 'plus';
+    if (action.includes('update')) return 'edit';
+    if (action.includes('delete')) return 'trash';
+    return 'info';
+}
+
+function prependActivity(activity) {
+    const list = document.getElementById('recent-activities-list');
+    if (!list) return;
+    
+    const item = document.createElement('div');
+    item.style.cssText = 'border-bottom: 1px solid #eee; padding: 1rem;';
+    
+    const header = document.createElement('div');
+    header.style.cssText = 'display: flex; justify-content: space-between;';
+    const title = document.createElement('strong');
+    const icon = document.createElement('i');
+    icon.className = `fas fa-${activityIcon(activity.action)}`;
+    title.append(icon, ` ${activity.description || ''}`);
+    const date = document.createElement('small');
+    date.style.color = '#666';
+    const iso = activity.created_at || '';
+    date.textContent = iso ? `${iso.slice(8, 10)}/${iso.slice(5, 7)}/${iso.slice(0, 4)} ${iso.slice(11, 16)}` : '';
+    header.append(title, date);
+    
+    const author = document.createElement('small');
+    author.style.color = '#999';
+    author.textContent = `Par ${activity.user}`;
+    
+    item.append(header, author);
+    list.prepend(item);
+    while (list.children.length > 10) {
+        list.lastElementChild.remove();
+    }
+}
+
+function applyCounterDeltas(data) {
+    // Compteurs globaux (user_id 0) ou personnels (dashboard utilisateur)
+    Object.entries(data.deltas).forEach(([name, delta]) => {
+        const id = data.user_id === 0 ? COUNTER_ELEMENTS[name] : `my-${name}`;
+        const element = id && document.getElementById(id);
+        if (element) {
+            element.textContent = (parseInt(element.textContent, 10) || 0) + delta;
+        }
+    });
+}
+
+function connectActivityStream() {
+    const source = new EventSource('/api/stream/activity');
+    source.addEventListener('counters', event => applyCounterDeltas(JSON.parse(event.data)));
+    source.addEventListener('activity', event => prependActivity(JSON.parse(event.data)));
+    // Après une reconnexion, les compteurs sont relus une fois pour rattraper les événements manqués
+    source.addEventListener('open', () => {
+        if (source.reconnected) loadDashboardStats();
+        source.reconnected = true;
+    });
+    return source;
+}
+
 // Chargement initial du dashboard si on est sur la page
 if (window.location.pathname.includes('dashboard')) {
-    loadDashboardStats();
-    // Rafraîchir toutes les 30 secondes
-    setInterval(loadDashboardStats, 30000);
+    if ('EventSource' in window) {
+        connectActivityStream();
+    } else {
+        loadDashboardStats();
+        // Rafraîchir toutes les 30 secondes
+        setInterval(loadDashboardStats, 30000);
+    }
 }
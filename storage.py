@@ -0,0 +1,241 @@
+"""
+Stockage des fichiers uploadés adressé par contenu
+Chaque contenu est écrit une seule fois sous UPLOAD_FOLDER/ab/cd/<sha256> et partagé par
+tous les FileUpload de même empreinte. FileBlob.ref_count est ajusté dans la transaction
+qui crée ou supprime les FileUpload ; le fichier n'est supprimé qu'après le commit qui
+retire sa dernière référence.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from models import db, FileBlob, FileUpload, increment_row
+
+logger = logging.getLogger(__name__)
+
+# Sous-dossier de UPLOAD_FOLDER des fichiers en cours d'écriture (même système de fichiers
+# que les blobs : os.replace est atomique)
+TEMP_FOLDER = 'tmp'
+
+# Taille des blocs lus pour hacher un fichier existant
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def blob_name(sha256):
+    """Chemin relatif d'un contenu dans UPLOAD_FOLDER : ab/cd/<sha256>"""
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+def blob_path(sha256):
+    """Chemin absolu d'un contenu"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], *blob_name(sha256).split('/'))
+
+def is_blob(file_upload):
+    """FileUpload stocké par contenu (les fichiers plus anciens restent à plat jusqu'à flask migrate-uploads)"""
+    return bool(file_upload.sha256) and file_upload.filename == blob_name(file_upload.sha256)
+
+def temp_path(name=None):
+    """Chemin d'un fichier temporaire dans UPLOAD_FOLDER/tmp (créé si besoin)"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], TEMP_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name or uuid.uuid4().hex)
+
+def hash_file(path):
+    """SHA-256 hexadécimal d'un fichier"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_BUFFER_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.exception('Suppression impossible: %s', path)
+
+# ==================== ÉCRITURE ====================
+
+def place_blob(source_path, sha256):
+    """
+    Range source_path (contenu déjà haché) à l'emplacement de son blob, ou le supprime
+    si ce contenu est déjà stocké
+    Retourne True si le fichier a été écrit
+    """
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        os.remove(source_path)
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source_path, target)
+    return True
+
+def store_upload(source_path, sha256, size, **fields):
+    """
+    Crée le FileUpload du contenu source_path et range le fichier dans son blob
+    La référence est comptée au flush (ligne FileBlob verrouillée jusqu'au commit) avant
+    de déposer le fichier : la suppression concurrente de la dernière référence ne peut
+    pas effacer le contenu entre les deux
+    Retourne le FileUpload (à valider par l'appelant)
+    """
+    file_upload = FileUpload(
+        filename=blob_name(sha256),
+        file_path=blob_path(sha256),
+        file_size=size,
+        sha256=sha256,
+        **fields
+    )
+    db.session.add(file_upload)
+    db.session.flush()
+    place_blob(source_path, sha256)
+    return file_upload
+
+# ==================== RÉFÉRENCES ====================
+
+def adjust_blob_refs(session, deltas, sizes=None):
+    """
+    Applique {sha256: delta} aux compteurs de références dans la transaction courante
+    À appeler explicitement après des écritures qui ne passent pas par le flush de la session
+    """
+    table = FileBlob.__table__
+    connection = session.connection()
+    # Upsert atomique (deux uploads simultanés du même contenu), dans un ordre fixe :
+    # pas d'interblocage entre transactions concurrentes
+    for sha256, delta in sorted(deltas.items()):
+        if delta:
+            increment_row(connection, table, {'sha256': sha256}, {'ref_count': delta},
+                          {'size': (sizes or {}).get(sha256)} if delta > 0 else None)
+
+def remove_unreferenced(engine, blobs):
+    """
+    Supprime les blobs {sha256: chemin} qui n'ont plus de référence
+    La ligne FileBlob est supprimée (et verrouillée) avant le fichier : un upload concurrent
+    du même contenu attend le commit puis recrée la ligne et redépose le fichier
+    Retourne le nombre de fichiers supprimés
+    """
+    table = FileBlob.__table__
+    removed = 0
+    with Session(engine) as session:
+        for sha256, path in sorted(blobs.items()):
+            result = session.execute(delete(table).where(table.c.sha256 == sha256, table.c.ref_count <= 0))
+            if result.rowcount:
+                _unlink(path)
+                removed += 1
+        session.commit()
+    return removed
+
+@event.listens_for(Session, 'after_flush')
+def _count_blob_references(session, flush_context):
+    """Compte les FileUpload créés ou supprimés par blob ; note les fichiers à libérer"""
+    deltas, sizes = {}, {}
+    for obj in session.new:
+        if isinstance(obj, FileUpload) and is_blob(obj):
+            deltas[obj.sha256] = deltas.get(obj.sha256, 0) + 1
+            sizes[obj.sha256] = obj.file_size
+    for obj in session.deleted:
+        if not isinstance(obj, FileUpload):
+            continue
+        if is_blob(obj):
+            deltas[obj.sha256] = deltas.get(obj.sha256, 0) - 1
+            session.info.setdefault('released_blobs', {})[obj.sha256] = obj.file_path
+        else:
+            # Fichier à plat non partagé : supprimé après le commit
+            session.info.setdefault('released_files', []).append(obj.file_path)
+    if deltas:
+        adjust_blob_refs(session, deltas, sizes)
+
+@event.listens_for(Session, 'after_commit')
+def _release_files(session):
+    """Supprime les fichiers dont la dernière référence vient d'être validée"""
+    blobs = session.info.pop('released_blobs', None)
+    files = session.info.pop('released_files', None)
+    if blobs:
+        remove_unreferenced(session.get_bind(), blobs)
+    for path in files or ():
+        _unlink(path)
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_files(session):
+    """Suppressions annulées : les fichiers restent"""
+    session.info.pop('released_blobs', None)
+    session.info.pop('released_files', None)
+
+# ==================== MIGRATION ====================
+
+def migrate_uploads(chunk_size=500):
+    """
+    Range les fichiers à plat (antérieurs au stockage par contenu) dans les blobs :
+    hache ceux qui n'ont pas d'empreinte, supprime les doublons, puis recalcule les références
+    Reprise possible après interruption : un fichier déjà déplacé est retrouvé par son empreinte
+    Retourne {'migrated', 'duplicates', 'missing'}
+    """
+    stats = {'migrated': 0, 'duplicates': 0, 'missing': 0}
+    last_id = 0
+    while True:
+        uploads = db.session.scalars(
+            select(FileUpload).where(FileUpload.id > last_id).order_by(FileUpload.id).limit(chunk_size)
+        ).all()
+        if not uploads:
+            break
+        last_id = uploads[-1].id
+        duplicates = []
+        for upload in uploads:
+            if is_blob(upload):
+                continue
+            sha256 = upload.sha256
+            if os.path.exists(upload.file_path):
+                sha256 = sha256 or hash_file(upload.file_path)
+                if os.path.exists(blob_path(sha256)):
+                    duplicates.append(upload.file_path)
+                else:
+                    os.makedirs(os.path.dirname(blob_path(sha256)), exist_ok=True)
+                    os.replace(upload.file_path, blob_path(sha256))
+            elif not (sha256 and os.path.exists(blob_path(sha256))):
+                stats['missing'] += 1
+                continue
+            upload.sha256 = sha256
+            upload.filename = blob_name(sha256)
+            upload.file_path = blob_path(sha256)
+            stats['migrated'] += 1
+        db.session.commit()
+        # Doublons supprimés une fois leurs lignes rattachées au blob
+        for path in duplicates:
+            _unlink(path)
+        stats['duplicates'] += len(duplicates)
+        db.session.expunge_all()
+    reconcile_blob_refs()
+    return stats
+
+def reconcile_blob_refs():
+    """
+    Recalcule FileBlob.ref_count depuis les FileUpload et supprime les blobs sans référence
+    Retourne le nombre de compteurs corrigés
+    """
+    counts = {
+        sha256: (count, size) for sha256, count, size in db.session.execute(
+            select(FileUpload.sha256, func.count(), func.max(FileUpload.file_size)).where(
+                FileUpload.sha256.isnot(None), FileUpload.filename.like('%/%')
+            ).group_by(FileUpload.sha256)
+        )
+    }
+    existing = dict(db.session.execute(select(FileBlob.sha256, FileBlob.ref_count)).all())
+    table = FileBlob.__table__
+    corrected = 0
+    for sha256, (count, size) in counts.items():
+        if sha256 not in existing:
+            db.session.execute(insert(table).values(sha256=sha256, size=size, ref_count=count))
+        elif existing[sha256] != count:
+            db.session.execute(update(table).where(table.c.sha256 == sha256).values(ref_count=count))
+        else:
+            continue
+        corrected += 1
+    unreferenced = set(existing) - set(counts)
+    if unreferenced:
+        db.session.execute(update(table).where(table.c.sha256.in_(unreferenced)).values(ref_count=0))
+        corrected += len(unreferenced)
+    db.session.commit()
+    remove_unreferenced(db.engine, {sha256: blob_path(sha256) for sha256 in unreferenced})
+    return corrected
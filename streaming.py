@@ -0,0 +1,56 @@
+"""
+Réponses JSON en flux continu
+Exporte de grands ensembles de lignes sans les charger en mémoire
+"""
+from flask import Response, stream_with_context
+from sqlalchemy.sql import Select
+from models import db
+from serializers import dumps
+
+# Formats d'export supportés par les endpoints de liste
+STREAM_FORMATS = ('ndjson', 'stream')
+
+# Nombre de lignes récupérées par aller-retour avec le curseur serveur
+STREAM_BATCH_SIZE = 500
+
+def iter_rows(query, batch_size=STREAM_BATCH_SIZE):
+    """Parcourt une requête ORM ou un select() Core via un curseur côté serveur (yield_per)"""
+    if isinstance(query, Select):
+        return db.session.execute(query, execution_options={'yield_per': batch_size})
+    return query.yield_per(batch_size)
+
+def _ndjson(rows, serialize):
+    """Génère une ligne JSON par objet"""
+    for row in rows:
+        yield dumps(serialize(row)) + b'\n'
+
+def _json_array(rows, serialize, key):
+    """Génère l'enveloppe {"success", key: [...], "count"} morceau par morceau"""
+    yield b'{"success":true,"%s":[' % key.encode('ascii')
+    count = 0
+    for row in rows:
+        if count:
+            yield b','
+        yield dumps(serialize(row))
+        count += 1
+    yield b'],"count":%d}' % count
+
+def stream_response(query, serialize, key, fmt):
+    """
+    Construit une réponse en flux pour une requête ORM ou un select() Core
+    serialize: convertit un objet ou une ligne en dictionnaire
+    fmt: 'ndjson' (une ligne par objet) ou 'stream' (tableau JSON progressif)
+    """
+    rows = iter_rows(query)
+
+    if fmt == 'ndjson':
+        body = _ndjson(rows, serialize)
+        mimetype = 'application/x-ndjson'
+    else:
+        body = _json_array(rows, serialize, key)
+        mimetype = 'application/json'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    # Empêcher les proxys de bufferiser la réponse
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
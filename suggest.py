@@ -0,0 +1,158 @@
+"""
+Autocomplétion des noms de produits et des catégories
+Index en mémoire (tableau trié + recherche dichotomique), mis à jour
+incrémentalement à chaque écriture sur le catalogue
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import select
+from models import db, Product, catalog_changed, get_catalog_version
+from search import normalize
+
+# Types de suggestions, dans leur ordre d'affichage
+SUGGESTION_KINDS = ('category', 'product')
+
+class SuggestIndex:
+    """
+    Tableau trié de clés (texte normalisé, type, libellé)
+    Chaque mot d'un libellé est indexé : "Casque audio Sony" est trouvé avec "aud"
+    """
+
+    def __init__(self, version_check=5.0):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._counts = {}
+        self._ready = False
+        self._version = None
+        self._checked_at = 0.0
+        self.version_check = version_check
+
+    @staticmethod
+    def _keys_for(kind, label):
+        """Clés d'un libellé : une par position de mot"""
+        words = normalize(label).split()
+        return [(' '.join(words[position:]), kind, label) for position in range(len(words))]
+
+    def _add(self, kind, label):
+        if not label:
+            return
+        entry = (kind, label)
+        count = self._counts.get(entry, 0)
+        self._counts[entry] = count + 1
+        if count == 0:
+            for key in self._keys_for(kind, label):
+                insort(self._keys, key)
+
+    def _remove(self, kind, label):
+        if not label:
+            return
+        entry = (kind, label)
+        count = self._counts.get(entry, 0)
+        if count <= 1:
+            self._counts.pop(entry, None)
+            for key in self._keys_for(kind, label):
+                position = bisect_left(self._keys, key)
+                if position < len(self._keys) and self._keys[position] == key:
+                    del self._keys[position]
+        else:
+            self._counts[entry] = count - 1
+
+    def _rebuild(self):
+        """Reconstruit l'index complet depuis la base (démarrage ou modification en lot)"""
+        self._keys, self._counts = [], {}
+        version, _ = get_catalog_version()
+        rows = db.session.execute(
+            select(Product.name, Product.category), execution_options={'yield_per': 1000}
+        )
+        keys = []
+        for name, category in rows:
+            for kind, label in (('product', name), ('category', category)):
+                if not label:
+                    continue
+                entry = (kind, label)
+                self._counts[entry] = self._counts.get(entry, 0) + 1
+                if self._counts[entry] == 1:
+                    keys.extend(self._keys_for(kind, label))
+        keys.sort()
+        self._keys = keys
+        self._version = version
+        self._ready = True
+
+    def apply(self, changes, bumps=0):
+        """
+        Applique des modifications de produits (voir models._product_change)
+        changes=None signifie une modification inconnue : reconstruction complète
+        bumps: incréments de la version du catalogue faits par la transaction appliquée
+        """
+        with self._lock:
+            if not self._ready:
+                return
+            if changes is None:
+                self._ready = False
+                return
+            for op, product_id, old, new in changes:
+                if old:
+                    self._remove('product', old[0])
+                    self._remove('category', old[1])
+                if new:
+                    self._add('product', new[0])
+                    self._add('category', new[1])
+            # La version locale suit les écritures de ce processus : toute autre
+            # différence avec la base vient d'un autre worker (reconstruction)
+            if self._version is not None:
+                self._version += bumps
+
+    def _ensure_fresh(self):
+        """
+        Construit l'index au premier appel ; vérifie au plus toutes les
+        version_check secondes qu'un autre worker n'a pas modifié le catalogue
+        """
+        now = time.monotonic()
+        if not self._ready:
+            self._rebuild()
+            self._checked_at = now
+        elif now - self._checked_at >= self.version_check:
+            self._checked_at = now
+            version, _ = get_catalog_version()
+            if version != self._version:
+                self._rebuild()
+
+    def suggest(self, prefix, limit=10):
+        """Retourne au plus limit suggestions [{'value', 'type', 'count'}] pour un préfixe"""
+        prefix = ' '.join(normalize(prefix).split())
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_fresh()
+            # Toutes les clés du préfixe sont parcourues : le classement par nombre
+            # d'occurrences ne suit pas l'ordre alphabétique de l'index
+            found = {kind: {} for kind in SUGGESTION_KINDS}
+            position = bisect_left(self._keys, (prefix,))
+            while position < len(self._keys):
+                key, kind, label = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                found[kind].setdefault(label, self._counts.get((kind, label), 0))
+                position += 1
+
+        suggestions = [
+            {'value': label, 'type': kind, 'count': count}
+            for kind in SUGGESTION_KINDS
+            for label, count in heapq.nsmallest(limit, found[kind].items(),
+                                                key=lambda item: (-item[1], item[0]))
+        ]
+        return suggestions[:limit]
+
+suggest_index = SuggestIndex()
+
+@catalog_changed.connect
+def _update_suggest_index(sender, changes=None, bumps=0, **kwargs):
+    """Met à jour l'index après chaque transaction ayant modifié des produits"""
+    suggest_index.apply(changes, bumps)
+
+def init_suggest(app):
+    """Configure l'intervalle de vérification de version depuis la configuration"""
+    suggest_index.version_check = app.config.get('SUGGEST_VERSION_CHECK', 5.0)
+    return suggest_index
@@ -0,0 +1,65 @@
+"""
+Résumé du tableau de bord personnel
+Produits, activités et fichiers récents d'un utilisateur lus en une seule
+requête (UNION ALL de trois sous-requêtes indexées), compteurs précalculés à part
+"""
+from sqlalchemy import Float, Integer, cast, literal, null, select, union_all
+from models import db, Product, ActivityLog, FileUpload
+
+RECENT_PRODUCTS = 5
+RECENT_ACTIVITIES = 10
+RECENT_UPLOADS = 5
+
+def recent_items_query(user_id):
+    """
+    UNION ALL des éléments récents d'un utilisateur
+    Colonnes communes : kind, id, title, label, amount, size, at
+    Chaque branche est triée et limitée dans sa sous-requête (index (user_id, date))
+    """
+    products = select(
+        literal('product').label('kind'), Product.id, Product.name.label('title'),
+        Product.category.label('label'), Product.price.label('amount'),
+        Product.stock.label('size'), Product.created_at.label('at')
+    ).where(Product.user_id == user_id).order_by(
+        Product.created_at.desc()
+    ).limit(RECENT_PRODUCTS).subquery()
+    activities = select(
+        literal('activity').label('kind'), ActivityLog.id, ActivityLog.description.label('title'),
+        ActivityLog.action.label('label'), cast(null(), Float).label('amount'),
+        cast(null(), Integer).label('size'), ActivityLog.created_at.label('at')
+    ).where(ActivityLog.user_id == user_id).order_by(
+        ActivityLog.created_at.desc()
+    ).limit(RECENT_ACTIVITIES).subquery()
+    uploads = select(
+        literal('upload').label('kind'), FileUpload.id, FileUpload.original_filename.label('title'),
+        FileUpload.mime_type.label('label'), cast(null(), Float).label('amount'),
+        FileUpload.file_size.label('size'), FileUpload.uploaded_at.label('at')
+    ).where(FileUpload.user_id == user_id).order_by(
+        FileUpload.uploaded_at.desc()
+    ).limit(RECENT_UPLOADS).subquery()
+    return union_all(select(products), select(activities), select(uploads))
+
+def recent_items(user_id):
+    """
+    Éléments récents d'un utilisateur en un aller-retour
+    Retourne {'products': [...], 'activities': [...], 'uploads': [...]} (dictionnaires
+    avec les champs attendus par user_dashboard.html), du plus récent au plus ancien
+    """
+    items = {'products': [], 'activities': [], 'uploads': []}
+    rows = db.session.execute(recent_items_query(user_id)).all()
+    for row in sorted(rows, key=lambda row: (row.at is not None, row.at), reverse=True):
+        if row.kind == 'product':
+            items['products'].append({
+                'id': row.id, 'name': row.title, 'category': row.label,
+                'price': row.amount, 'stock': row.size, 'created_at': row.at
+            })
+        elif row.kind == 'activity':
+            items['activities'].append({
+                'id': row.id, 'description': row.title, 'action': row.label, 'created_at': row.at
+            })
+        else:
+            items['uploads'].append({
+                'id': row.id, 'original_filename': row.title, 'mime_type': row.label,
+                'file_size': row.size, 'uploaded_at': row.at
+            })
+    return items
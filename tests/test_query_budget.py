@@ -0,0 +1,103 @@
+"""
+Budgets de requêtes SQL des vues (@query_budget)
+Chaque vue budgétée est appelée en configuration de test, première requête du processus
+comprise (détections et index construits à la demande) : un dépassement lève
+QueryBudgetExceeded et fait échouer le test
+"""
+import pytest
+from flask import jsonify
+import search
+from app import create_app
+from cache import product_cache
+from config import TestingConfig
+from fragment_cache import fragment_cache
+from models import db, User, Role, Product, FileUpload, ActivityLog
+from principal import principal_cache
+from query_stats import QueryBudgetExceeded, query_budget
+from schema import upgrade_schema
+from suggest import suggest_index
+
+# URL appelée pour chaque vue budgétée ({product_id} : produit existant)
+BUDGETED_URLS = {
+    'api.get_products': '/api/products?limit=20',
+    'api.search_products_api': '/api/products/search?q=produit',
+    'api.suggest_products': '/api/products/suggest?q=pro',
+    'api.get_product_facets': '/api/products/facets',
+    'api.get_product': '/api/products/{product_id}',
+    'api.get_users': '/api/users',
+    'api.get_uploads': '/api/uploads',
+    'api.get_dashboard_stats': '/api/stats/dashboard',
+    'api.get_activity_stats': '/api/stats/activity?interval=day',
+    'main.dashboard': '/dashboard',
+    'main.products': '/products',
+    'main.view_product': '/products/{product_id}',
+}
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "test.db"}')
+    app = create_app('testing')
+    app.config['QUERY_STATS_HEADERS'] = True
+
+    for cache in (product_cache, fragment_cache, principal_cache):
+        cache.clear()
+
+    with app.app_context():
+        upgrade_schema(echo=lambda message: None)
+        admin_role = Role(name='admin')
+        admin = User(username='admin', email='admin@example.com', roles=[admin_role])
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.flush()
+        db.session.add_all(Product(
+            name=f'Produit {index}', description=f'Description du produit {index}',
+            price=10.0 + index, stock=index, category=('Livres', 'Sport')[index % 2], user_id=admin.id
+        ) for index in range(30))
+        db.session.add(FileUpload(
+            filename='a.txt', original_filename='a.txt', file_path='/dev/null', file_size=1, user_id=admin.id
+        ))
+        db.session.add(ActivityLog(user_id=admin.id, action='login', description='Connexion'))
+        db.session.commit()
+    # Index reconstruits à la première requête, comme dans un worker qui démarre
+    monkeypatch.setattr(search, '_backend', None)
+    suggest_index.apply(None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with app.app_context():
+        admin_id = db.session.scalar(db.select(User.id).where(User.username == 'admin'))
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    return client
+
+def _budgeted_views(app):
+    return {endpoint: view.query_budget for endpoint, view in app.view_functions.items()
+            if hasattr(view, 'query_budget')}
+
+def test_every_budgeted_view_is_covered(app):
+    assert set(_budgeted_views(app)) == set(BUDGETED_URLS)
+
+@pytest.mark.parametrize('endpoint', sorted(BUDGETED_URLS))
+def test_view_stays_within_budget(app, client, endpoint):
+    with app.app_context():
+        product_id = db.session.scalar(db.select(Product.id).order_by(Product.id).limit(1))
+    response = client.get(BUDGETED_URLS[endpoint].format(product_id=product_id))
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) <= _budgeted_views(app)[endpoint]
+
+def test_budget_exceeded_raises(app, client):
+    @app.route('/_test/over-budget')
+    @query_budget(1)
+    def over_budget():
+        db.session.scalar(db.select(Product.id).limit(1))
+        db.session.scalar(db.select(User.id).limit(1))
+        return jsonify({})
+
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/_test/over-budget')